@@ -24,11 +24,29 @@ ngram given appropriate frequency counts. A number of standard association
 measures are provided in bigram_measures and trigram_measures.
 """
 
+import copy as _copy
+import heapq
 import itertools as _itertools
+import json
+import math as _math
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
+from collections.abc import Mapping, Sequence
+from operator import itemgetter
+from time import perf_counter
 
 from nltkma.probability import FreqDist
-from nltkma.util import ngrams
+from nltkma.util import current_instrumentation, instrumented_stage, ngrams
+from nltkma.metrics.association import vectorized_measure
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
 
 # these two unused imports are referenced in collocations.doctest
 from nltkma.metrics import (
@@ -49,8 +67,18 @@ class AbstractCollocationFinder:
     word in a corpus, and the joint frequency of word tuples. This data
     should be provided through nltk.probability.FreqDist objects or an
     identical interface.
+
+    Finders built from an ``EncodedCorpus`` count on its token IDs: their
+    frequency distributions, ``pos`` and ``dist`` are keyed by token IDs,
+    and ``vocabulary`` maps the IDs back to tokens.  The ngrams reported by
+    ``score_ngrams``, ``nbest``, ``above_score`` and ``score_ngrams_multi``
+    are always tokens.
     """
 
+    #: The tokens of the IDs keying the counts, or None if they are keyed by
+    #: the tokens themselves.
+    vocabulary = None
+
     def __init__(self, word_fd, ngram_fd):
         self.word_fd = word_fd
         self.N = word_fd.N()
@@ -87,60 +115,619 @@ class AbstractCollocationFinder:
     def _ngram_freqdist(words, n):
         return FreqDist(tuple(words[i: i + n]) for i in range(len(words) - 1))
 
+    def _decode_ngram(self, ngram):
+        """Returns the tokens of an ngram keying the counts of this finder."""
+        vocabulary = self.vocabulary
+        if vocabulary is None:
+            return ngram
+        return tuple(vocabulary[i] for i in ngram)
+
+    def _decoded(self):
+        """Returns this finder if its counts are keyed by tokens, or else a
+        copy of it whose counts are keyed by tokens rather than token IDs.
+        """
+        vocabulary = self.vocabulary
+        if vocabulary is None:
+            return self
+        finder = _copy.copy(self)
+        del finder.vocabulary
+        for name, value in list(vars(finder).items()):
+            if isinstance(value, FreqDist):
+                setattr(finder, name, _decode_keys(value, vocabulary, FreqDist()))
+            elif isinstance(value, PositionStore):
+                setattr(finder, name, value.relabel(self._decode_ngram))
+        return finder
+
+    def save(self, path):
+        """Saves the counts of this finder to the file ``path`` in a compact
+        binary layout: a table of the tokens, arrays of token IDs keying
+        each frequency distribution together with arrays of their counts,
+        and offset arrays delimiting each ngram's list of ``pos`` or
+        ``dist`` values in one flat array.
+
+        Only the counts are saved, so a loaded finder cannot be extended
+        with ``update`` or ``merge``.  The counts of a finder built from an
+        ``EncodedCorpus`` are saved keyed by tokens.
+        """
+        _save_finder(self._decoded(), path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a finder saved with ``save``.
+
+        If ``mmap`` is true the file is mapped into memory and the values of
+        the ``pos`` and ``dist`` stores are read from the mapping, which
+        processes loading the same file share.  Otherwise they are copied
+        into memory.  The frequency distributions are always rebuilt as
+        ``FreqDist`` objects.
+        """
+        return _load_finder(cls, path, mmap)
+
     def _apply_filter(self, fn=lambda ngram, freq: False):
         """Generic filter removes ngrams from the frequency distribution
-        if the function returns True when passed an ngram tuple.
+        if the function returns True when passed an ngram tuple.  The
+        ngrams are removed in place, in a single pass.
+        """
+        removed = [ngram for ngram, freq in self.ngram_fd.items() if fn(ngram, freq)]
+        for ngram in removed:
+            del self.ngram_fd[ngram]
+
+    def apply_filters(self, min_freq=None, word_filter=None, stopwords=None, ngram_filter=None):
+        """Removes, in a single pass over the candidate ngrams, those which
+        have frequency less than ``min_freq``, those containing a word in
+        ``stopwords`` or a word for which ``word_filter`` evaluates to True,
+        and those (w1, w2, ...) where ``ngram_filter(w1, w2, ...)`` evaluates
+        to True.  ``word_filter`` is called once for each distinct word.
+        A filtered finder can no longer be updated or merged.
         """
-        tmp_ngram = FreqDist()
-        for ngram, freq in self.ngram_fd.items():
-            if not fn(ngram, freq):
-                tmp_ngram[ngram] = freq
-        self.ngram_fd = tmp_ngram
+        excluded = _word_exclusion(word_filter, stopwords)
+        if (min_freq, excluded, ngram_filter) != (None, None, None):
+            self._filtered = True
+        decode = self.vocabulary is not None and (excluded, ngram_filter) != (None, None)
+
+        def fn(ngram, freq):
+            if decode:
+                ngram = self._decode_ngram(ngram)
+            return (
+                (min_freq is not None and freq < min_freq)
+                or (excluded is not None and any(excluded(w) for w in ngram))
+                or (ngram_filter is not None and ngram_filter(*ngram))
+            )
+
+        self._apply_filter(fn)
 
     def apply_freq_filter(self, min_freq):
         """Removes candidate ngrams which have frequency less than min_freq."""
-        self._apply_filter(lambda ng, freq: freq < min_freq)
+        self.apply_filters(min_freq=min_freq)
 
     def apply_ngram_filter(self, fn):
         """Removes candidate ngrams (w1, w2, ...) where fn(w1, w2, ...)
         evaluates to True.
         """
-        self._apply_filter(lambda ng, f: fn(*ng))
+        self.apply_filters(ngram_filter=fn)
 
     def apply_word_filter(self, fn):
         """Removes candidate ngrams (w1, w2, ...) where any of (fn(w1), fn(w2),
         ...) evaluates to True.
         """
-        self._apply_filter(lambda ng, f: any(fn(w) for w in ng))
+        self.apply_filters(word_filter=fn)
 
     def _score_ngrams(self, score_fn):
         """Generates of (ngram, score) pairs as determined by the scoring
         function provided.
         """
+        decode = self._decode_ngram
+        scored = self._vectorized_scores(score_fn)
+        if scored is not None:
+            ngrams, scores = scored
+            yield from zip(map(decode, ngrams), scores.tolist())
+            return
         for tup in self.ngram_fd:
             score = self.score_ngram(score_fn, *tup)
             if score is not None:
-                yield tup, score
+                yield decode(tup), score
+
+    def _vectorized_scores(self, score_fn):
+        """Returns a list of ngrams and an array of their scores, scoring all
+        ngrams in one call to the NumPy form of the scoring function, or None
+        if it has no such form.  Scores may differ from those of
+        ``score_ngram`` in the last digits, so ngrams with nearly equal scores
+        may be ranked in a different order.  If any score is not finite, None
+        is returned so that the ngrams are scored one by one and degenerate
+        counts fail or score exactly as they would otherwise.
+        """
+        vectorized_fn = vectorized_measure(score_fn)
+        if vectorized_fn is None:
+            return None
+        ngrams, rows = self._marginal_rows()
+        scores = _vectorized_column(vectorized_fn, _marginal_columns(rows))
+        if scores is None:
+            return None
+        return ngrams, scores
+
+    def _marginal_rows(self):
+        """Returns a list of the ngrams which can be scored, and a list of the
+        arguments a scoring function is called with for each of them.
+        """
+        ngrams = []
+        rows = []
+        for tup in self.ngram_fd:
+            marginals = self.score_ngram(_marginals, *tup)
+            if marginals is not None:
+                ngrams.append(tup)
+                rows.append(marginals)
+        return ngrams, rows
+
+    def score_ngrams_multi(self, score_fns):
+        """Scores the ngrams with each of the scoring functions ``score_fns``,
+        gathering the marginals of each ngram only once, and returns the
+        scores as a table of columns: a dictionary mapping ``"ngram"`` to the
+        list of ngrams, in the order of ``ngram_fd``, and the name of each
+        scoring function to the list of its scores of these ngrams.
+
+        ``score_fns`` is a sequence of functions, named by their
+        ``__name__``, or a dictionary of functions by name.  Functions with a
+        NumPy form are evaluated on arrays of all the marginals at once, as
+        in ``nbest``.
+        """
+        if not isinstance(score_fns, Mapping):
+            named = {}
+            for score_fn in score_fns:
+                if score_fn.__name__ in named:
+                    raise ValueError(
+                        "Several scoring functions are named %r; pass a dictionary of them by name"
+                        % score_fn.__name__
+                    )
+                named[score_fn.__name__] = score_fn
+            score_fns = named
+        if "ngram" in score_fns:
+            raise ValueError('"ngram" cannot name a scoring function')
+
+        ngrams, rows = self._marginal_rows()
+        table = {"ngram": [self._decode_ngram(ngram) for ngram in ngrams]}
+        columns = None
+        for name, score_fn in score_fns.items():
+            scores = None
+            vectorized_fn = vectorized_measure(score_fn)
+            if vectorized_fn is not None:
+                if columns is None:
+                    columns = _marginal_columns(rows)
+                scores = _vectorized_column(vectorized_fn, columns)
+            if scores is None:
+                table[name] = [score_fn(*row) for row in rows]
+            else:
+                table[name] = scores.tolist()
+        return table
 
     def score_ngrams(self, score_fn):
         """Returns a sequence of (ngram, score) pairs ordered from highest to
         lowest score, as determined by the scoring function provided.
         """
-        return sorted(self._score_ngrams(score_fn), key=lambda t: (-t[1], t[0]))
+        return sorted(self._score_ngrams(score_fn), key=_ranking_key)
 
     def nbest(self, score_fn, n):
-        """Returns the top n ngrams when scored by the given function."""
-        return [p for p, s in self.score_ngrams(score_fn)[:n]]
+        """Returns the top n ngrams when scored by the given function, in
+        the order of ``score_ngrams``, without sorting all of the ngrams.
+        """
+        scored = self._vectorized_scores(score_fn)
+        if scored is None:
+            candidates = self._score_ngrams(score_fn)
+        else:
+            ngrams, scores = scored
+            if 0 < n < len(scores):
+                # keep the n highest scores and any ties with the lowest of them
+                threshold = scores[_np.argpartition(-scores, n - 1)[n - 1]]
+                keep = _np.flatnonzero(scores >= threshold).tolist()
+                ngrams = [ngrams[i] for i in keep]
+                scores = scores[keep]
+            candidates = zip(map(self._decode_ngram, ngrams), scores.tolist())
+        return [p for p, s in heapq.nsmallest(n, candidates, key=_ranking_key)]
 
     def above_score(self, score_fn, min_score):
         """Returns a sequence of ngrams, ordered by decreasing score, whose
         scores each exceed the given minimum score.
         """
-        for ngram, score in self.score_ngrams(score_fn):
-            if score > min_score:
-                yield ngram
-            else:
-                break
+        scored = [t for t in self._score_ngrams(score_fn) if t[1] > min_score]
+        for ngram, score in sorted(scored, key=_ranking_key):
+            yield ngram
+
+
+def _word_exclusion(word_filter, stopwords):
+    """Returns a function telling whether a word is in ``stopwords`` or
+    ``word_filter`` evaluates to True for it, which calls ``word_filter``
+    once for each distinct word, or None if there is neither.
+    """
+    if word_filter is None and not stopwords:
+        return None
+    stopwords = frozenset(stopwords or ())
+    decisions = {}
+
+    def excluded(w):
+        try:
+            return decisions[w]
+        except KeyError:
+            result = decisions[w] = w in stopwords or (word_filter is not None and bool(word_filter(w)))
+            return result
+
+    return excluded
+
+
+def _ranking_key(scored):
+    """Orders (ngram, score) pairs from highest to lowest score, and then by
+    ngram.
+    """
+    return -scored[1], scored[0]
+
+
+def _marginals(*marginals):
+    """A scoring function returning the marginals it is given."""
+    return marginals
+
+
+def _marginal_columns(rows):
+    """Returns the arguments of the NumPy form of a scoring function, given
+    the arguments of the scoring function for each ngram, or None if there
+    are no ngrams.
+    """
+    if not rows:
+        return None
+    columns = [_np.array([row[0] for row in rows], dtype=float)]
+    for i in range(1, len(rows[0]) - 1):
+        columns.append(tuple(_np.array([row[i] for row in rows], dtype=float).T))
+    columns.append(float(rows[0][-1]))
+    return columns
+
+
+def _vectorized_column(vectorized_fn, columns):
+    """Returns the array of scores given by the NumPy form of a scoring
+    function for the ``_marginal_columns`` of the ngrams, or None if any
+    score is not finite.
+    """
+    if columns is None:
+        return _np.zeros(0)
+    with _np.errstate(all="ignore"):
+        scores = vectorized_fn(*columns)
+    if not _np.isfinite(scores).all():
+        return None
+    return scores
+
+
+class CollocationIndex:
+    """
+    A positional inverted index over a sequence of tokens, mapping each
+    token to the sorted array of positions at which it occurs.
+
+    The index is built once and can then answer many pivot/target queries
+    (see ``BigramCollocationFinder.from_index``), each of which only touches
+    the occurrences of the queried tokens.  It also behaves as a read-only
+    sequence of the indexed tokens.
+
+        >>> index = CollocationIndex(['a', 'b', 'a', 'c'])
+        >>> list(index.positions('a'))
+        [0, 2]
+        >>> index.occurrences(['a', 'c'])
+        [0, 2, 3]
+        >>> index[1], len(index)
+        ('b', 4)
+    """
+
+    def __init__(self, words):
+        self._words = words if isinstance(words, list) else list(words)
+        positions = {}
+        for i, w in enumerate(self._words):
+            if w is None:
+                continue
+            try:
+                positions[w].append(i)
+            except KeyError:
+                positions[w] = array("l", [i])
+        self._positions = positions
+
+    def positions(self, token):
+        """Returns the sorted positions at which ``token`` occurs."""
+        return self._positions.get(token, array("l"))
+
+    def count(self, token):
+        """Returns the number of occurrences of ``token``."""
+        return len(self._positions.get(token, ()))
+
+    def occurrences(self, tokens):
+        """Returns a sorted list of the positions of all the given tokens."""
+        result = []
+        for token in set(tokens):
+            result.extend(self._positions.get(token, ()))
+        # the positions of each token form a sorted run, which sort() merges
+        result.sort()
+        return result
+
+    def vocabulary(self):
+        """Returns the set of distinct indexed tokens."""
+        return self._positions.keys()
+
+    def __len__(self):
+        return len(self._words)
+
+    def __getitem__(self, i):
+        return self._words[i]
+
+    def __iter__(self):
+        return iter(self._words)
+
+    def __repr__(self):
+        return "<CollocationIndex with %d tokens and %d types>" % (
+            len(self._words),
+            len(self._positions),
+        )
+
+
+class PositionStore(Mapping):
+    """
+    A compact store of the integer lists of ``BigramCollocationFinder.pos``
+    and ``.dist``, keyed by bigram.
+
+    The values of all keys share one append-only ``array('l')`` buffer, in
+    which each key owns a contiguous run given by its offset, length and
+    capacity.  A run that fills up is moved to the end of the buffer with
+    twice its capacity, so appending is amortized O(1), and ``finalize``
+    packs the runs tightly, in key order.
+
+    The store is a read-only mapping of each key to a ``PositionList``
+    view of its values, which compares equal to a list of the same values.
+
+        >>> store = PositionStore()
+        >>> store.append(('a', 'b'), 3)
+        >>> store.append_unique(('a', 'b'), 3)
+        >>> store.extend(('b', 'a'), [1, 4])
+        >>> store[('b', 'a')] == [1, 4], store[('a', 'b')][0], len(store)
+        (True, 3, 2)
+    """
+
+    def __init__(self, lists=None):
+        self._values = array("l")
+        # key -> [offset, length, capacity]
+        self._runs = {}
+        if lists is not None:
+            for key, values in lists.items():
+                self.extend(key, values)
+            self.finalize()
+
+    @classmethod
+    def _from_csr(cls, keys, offsets, values):
+        """Returns a store over ``values``, in which the values of the i-th
+        of ``keys`` are those from ``offsets[i]`` to ``offsets[i + 1]``.
+        """
+        store = cls.__new__(cls)
+        store._values = values
+        store._runs = {
+            key: [start, stop - start, stop - start]
+            for key, start, stop in zip(keys, offsets, offsets[1:])
+        }
+        return store
+
+    def _reserve(self, key, n):
+        """Returns the run of ``key``, moved if necessary so that ``n`` more
+        values fit into it.
+        """
+        values = self._values
+        run = self._runs.get(key)
+        if run is None:
+            run = self._runs[key] = [len(values), 0, 0]
+        start, length, capacity = run
+        if length + n <= capacity:
+            return run
+        if start + capacity == len(values):
+            # the run ends the buffer, so it can grow in place
+            values.extend([0] * (length + n - capacity))
+            run[2] = length + n
+            return run
+        capacity = max(2 * length, length + n)
+        run[0] = len(values)
+        run[2] = capacity
+        values.extend(values[start: start + length])
+        values.extend([0] * (capacity - length))
+        return run
+
+    def append(self, key, value):
+        """Appends ``value`` to the values of ``key``."""
+        run = self._runs.get(key)
+        if run is None or run[1] == run[2]:
+            run = self._reserve(key, 1)
+        self._values[run[0] + run[1]] = value
+        run[1] += 1
+
+    def append_unique(self, key, value):
+        """Appends ``value`` to the values of ``key``, unless it is already
+        the last of them.
+        """
+        run = self._runs.get(key)
+        if run is None or run[1] == run[2]:
+            if run is not None and run[1] and self._values[run[0] + run[1] - 1] == value:
+                return
+            run = self._reserve(key, 1)
+        elif run[1] and self._values[run[0] + run[1] - 1] == value:
+            return
+        self._values[run[0] + run[1]] = value
+        run[1] += 1
+
+    def extend(self, key, values):
+        """Appends each of ``values`` to the values of ``key``."""
+        values = array("l", values)
+        run = self._reserve(key, len(values))
+        start = run[0] + run[1]
+        self._values[start: start + len(values)] = values
+        run[1] += len(values)
+
+    def truncate(self, key, length):
+        """Keeps only the first ``length`` values of ``key``."""
+        run = self._runs[key]
+        run[1] = min(run[1], length)
+
+    def discard(self, key):
+        """Removes ``key`` and its values, if present."""
+        self._runs.pop(key, None)
+
+    def finalize(self):
+        """Packs the values of the keys contiguously, in key order, releasing
+        unused capacity.
+        """
+        values = self._values
+        packed = array("l")
+        for run in self._runs.values():
+            start, length, capacity = run
+            run[0] = len(packed)
+            run[2] = length
+            packed.extend(values[start: start + length])
+        self._values = packed
+
+    def relabel(self, fn):
+        """Returns a store of the same values keyed by ``fn(key)``."""
+        store = self.__class__.__new__(self.__class__)
+        store._values = self._values
+        store._runs = {fn(key): list(run) for key, run in self._runs.items()}
+        return store
+
+    def __getitem__(self, key):
+        if key not in self._runs:
+            raise KeyError(key)
+        return PositionList(self, key)
+
+    def __contains__(self, key):
+        return key in self._runs
+
+    def __iter__(self):
+        return iter(self._runs)
+
+    def __len__(self):
+        return len(self._runs)
+
+    def __repr__(self):
+        return "%s({%s})" % (
+            self.__class__.__name__,
+            ", ".join("%r: %r" % (key, values) for key, values in self.items()),
+        )
+
+
+class PositionList(Sequence):
+    """A read-only view of the values of one key of a ``PositionStore``."""
+
+    __slots__ = ("_store", "_key")
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+
+    def _run(self):
+        start, length, capacity = self._store._runs[self._key]
+        return start, length
+
+    def __len__(self):
+        return self._run()[1]
+
+    def __getitem__(self, i):
+        start, length = self._run()
+        if isinstance(i, slice):
+            return self._store._values[start: start + length][i].tolist()
+        if i < 0:
+            i += length
+        if not 0 <= i < length:
+            raise IndexError("position index out of range")
+        return self._store._values[start + i]
+
+    def __iter__(self):
+        start, length = self._run()
+        return iter(self._store._values[start: start + length].tolist())
+
+    def tolist(self):
+        """Returns the values as a list."""
+        return self[:]
+
+    def __eq__(self, other):
+        if isinstance(other, (PositionList, list, tuple)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+class EncodedCorpus:
+    """
+    A sequence of tokens stored compactly as an array of integer token IDs,
+    together with the vocabulary mapping each ID back to its token.
+
+    Collocation finders built from an encoded corpus count on the token IDs
+    and keep their counts keyed by them, decoding ngrams back to tokens only
+    when reporting them.  An encoded corpus also behaves as a read-only
+    sequence of its tokens, so it may be passed to ``find_concordance`` in
+    place of a token list.
+
+        >>> corpus = EncodedCorpus(['a', 'b', 'a', 'c'])
+        >>> list(corpus.ids), corpus.vocabulary
+        ([0, 1, 0, 2], ['a', 'b', 'c'])
+        >>> corpus[2], corpus[1:3], len(corpus)
+        ('a', ['b', 'a'], 4)
+    """
+
+    def __init__(self, words):
+        token_ids = {}
+        self.ids = array("i", [token_ids.setdefault(w, len(token_ids)) for w in words])
+        self.vocabulary = list(token_ids)
+        self._token_ids = token_ids
+
+    def token_id(self, token):
+        """Returns the ID of ``token``, or None if it does not occur."""
+        return self._token_ids.get(token)
+
+    def encode(self, tokens):
+        """Returns the IDs of those of the given tokens which occur."""
+        return [self._token_ids[t] for t in tokens if t in self._token_ids]
+
+    def decode(self, ids):
+        """Returns the tokens with the given IDs."""
+        vocabulary = self.vocabulary
+        return [vocabulary[i] for i in ids]
+
+    def occurrences(self, token_ids):
+        """Returns a sorted list of the positions of all the given token IDs."""
+        token_ids = set(token_ids)
+        if _np is not None and token_ids:
+            ids = _np.frombuffer(self.ids, dtype=_np.intc)
+            return _np.flatnonzero(_np.isin(ids, list(token_ids))).tolist()
+        return [i for i, t in enumerate(self.ids) if t in token_ids]
+
+    def index(self, token, start=0, stop=None):
+        """Returns the first position of ``token`` in ``self[start:stop]``."""
+        start, stop, _ = slice(start, stop).indices(len(self.ids))
+        token_id = self._token_ids.get(token)
+        if token_id is not None:
+            ids = self.ids
+            for i in range(start, stop):
+                if ids[i] == token_id:
+                    return i
+        raise ValueError("%r is not in the corpus" % (token,))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.decode(self.ids[i])
+        return self.vocabulary[self.ids[i]]
+
+    def __iter__(self):
+        return map(self.vocabulary.__getitem__, self.ids)
+
+    def __repr__(self):
+        return "<EncodedCorpus with %d tokens and %d types>" % (
+            len(self.ids),
+            len(self.vocabulary),
+        )
 
 
 class BigramCollocationFinder(AbstractCollocationFinder):
@@ -161,80 +748,355 @@ class BigramCollocationFinder(AbstractCollocationFinder):
         self.dist = dist
 
     @classmethod
-    def from_words(cls, pivot_token, target_token, words, span, allow_self_reference=False):
+    def from_words(
+            cls, pivot_token, target_token, words, span, allow_self_reference=False, min_freq=None,
+            word_filter=None, stopwords=None
+    ):
         """Construct a BigramCollocationFinder for all bigrams in the given
         sequence.  When window_size > 2, count non-contiguous bigrams, in the
         style of Church and Hanks's (1990) association ratio.
-        """
-        wfd = FreqDist()
-        bfd = FreqDist()
-        pos_pivot = defaultdict(list)
-        dist = defaultdict(list)
-
-        window_size = max(span) + 1
-
-        if window_size < 2:
-            raise ValueError("Specify window_size at least 2")
-        w1_index = -1
 
-        for window in ngrams(words, window_size, pad_left=False, pad_right=True):
-            w1_index += 1
+        The filters of ``apply_filters`` may be given to be applied while
+        counting: bigrams with a word in ``stopwords`` or a word for which
+        ``word_filter`` evaluates to True are never counted, and bigrams
+        counted less than ``min_freq`` times are dropped.  Unlike filters
+        applied afterwards, these also leave the bigrams out of ``pos`` and
+        ``dist``.  Word counts are not filtered.  A filtered finder cannot be
+        updated.
+        """
+        excluded = _word_exclusion(word_filter, stopwords)
+        if excluded is not None:
+            excluded = {w for w in set(pivot_token) | set(target_token) if excluded(w)}
+        filters = {"excluded": excluded, "min_freq": min_freq}
+        if isinstance(words, EncodedCorpus):
+            return cls._from_encoded(pivot_token, target_token, words, span, allow_self_reference, **filters)
+        if not isinstance(words, (list, tuple)):
+            words = list(words)
+        with instrumented_stage(current_instrumentation(), "scanning"):
+            occurrences, tokens, _ = _scan_occurrences(words, pivot_token, target_token)
+        return cls._from_occurrences(
+            pivot_token, target_token, occurrences, tokens, span, allow_self_reference, words=words, **filters
+        )
 
-            w1 = window[0]
-            w1_is_pivot_token = False
-            if w1 is None or (w1 not in pivot_token and w1 not in target_token):
-                continue
-            if w1 in pivot_token:
-                w1_is_pivot_token = True
+    @classmethod
+    def from_index(cls, pivot_token, target_token, index, span, allow_self_reference=False):
+        """Construct a BigramCollocationFinder from a ``CollocationIndex``.
 
-            wfd[w1] += 1
+        Only the occurrences of the pivot and target tokens are visited, so
+        repeated queries against the same index do not rescan the corpus.
+        The result is identical to calling ``from_words`` on the indexed words.
+        """
+        occurrences = index.occurrences(set(pivot_token) | set(target_token))
+        tokens = [index[i] for i in occurrences]
+        return cls._from_occurrences(
+            pivot_token, target_token, occurrences, tokens, span, allow_self_reference, words=index
+        )
 
-            w2_index = w1_index
+    @classmethod
+    def from_words_parallel(
+            cls, pivot_token, target_token, words, span, allow_self_reference=False, processes=2, chunk_size=None
+    ):
+        """Construct a BigramCollocationFinder as ``from_words`` does, counting
+        shards of the words in a pool of ``processes`` worker processes.
+
+        The words are split into chunks of ``chunk_size`` tokens (by default,
+        one chunk per process).  Each shard also reads the first
+        ``window_size - 1`` tokens of the next chunk, so that windows which
+        cross a chunk boundary are counted in full, but only pairs starting
+        within its own chunk.  The shard counts are merged in order, giving
+        the same ``word_fd``, ``ngram_fd``, ``pos`` and ``dist`` as
+        ``from_words``, with positions relative to the whole sequence.
+        """
+        from joblib import Parallel, delayed
+
+        window_size = _window_size(span)
+
+        if not isinstance(words, list):
+            words = list(words)
+        if chunk_size is None:
+            chunk_size = -(-len(words) // max(1, processes))
+        chunk_size = max(1, chunk_size)
+        overlap = window_size - 1
+
+        shards = [
+            (words[start: start + chunk_size + overlap], start, chunk_size)
+            for start in range(0, len(words), chunk_size)
+        ]
+        if processes <= 1 or len(shards) <= 1:
+            counts = [_count_bigram_shard(pivot_token, target_token, chunk, start, stop, span,
+                                          allow_self_reference)
+                      for chunk, start, stop in shards]
+        else:
+            counts = Parallel(n_jobs=processes)(
+                delayed(_count_bigram_shard)(pivot_token, target_token, chunk, start, stop, span,
+                                             allow_self_reference)
+                for chunk, start, stop in shards
+            )
 
-            for i in range(1, len(window)):
-                w2_index += 1
-                w2 = window[i]
+        wfd = FreqDist()
+        bfd = FreqDist()
+        pos_pivot = PositionStore()
+        dist = PositionStore()
+        for shard_wfd, shard_bfd, shard_pos, shard_dist in counts:
+            for w, count in shard_wfd.items():
+                wfd[w] += count
+            for ngram, count in shard_bfd.items():
+                bfd[ngram] += count
+            # windows starting in different shards never share a pivot
+            # position, so the shard positions can simply be concatenated
+            for ngram, positions in shard_pos.items():
+                pos_pivot.extend(ngram, positions)
+            for ngram, distances in shard_dist.items():
+                dist.extend(ngram, distances)
+        pos_pivot.finalize()
+        dist.finalize()
+
+        finder = cls(wfd, bfd, pos=pos_pivot, dist=dist, window_size=window_size)
+        finder._init_stream(pivot_token, target_token, span, allow_self_reference, words)
+        return finder
 
-                if w2 is None or (w2 == w1 and allow_self_reference is False):
-                    continue
+    @classmethod
+    def _from_occurrences(
+            cls, pivot_token, target_token, occurrences, tokens, span, allow_self_reference, words=None,
+            excluded=None, min_freq=None
+    ):
+        """Count pivot/target bigrams given the sorted positions of every pivot
+        or target token in ``words``, and the token found at each position.
+        Bigrams of ``excluded`` tokens are not counted, and those counted less
+        than ``min_freq`` times are dropped.
+        """
+        wfd = FreqDist()
+        bfd = FreqDist()
+        pos_pivot = PositionStore()
+        dist = PositionStore()
 
-                if w1_is_pivot_token:
-                    if w2 in target_token:
-                        # check that target token is within right span of pivot token
-                        if i <= span[1]:
-                            bfd[(w1, w2)] += 1
-
-                            if (w1, w2) in pos_pivot:
-                                if w1_index not in pos_pivot[(w1, w2)]:
-                                    pos_pivot[(w1, w2)].append(w1_index)
-                            else:
-                                pos_pivot[(w1, w2)].append(w1_index)
-
-                    else:
-                        continue
-                else:
-                    if w2 in pivot_token:
-                        # check that target token is within left span of pivot token
-                        if i <= span[0]:
-                            bfd[(w1, w2)] += 1
+        window_size = _window_size(span)
+        _count_pivot_target(
+            (wfd, bfd, pos_pivot, dist), pivot_token, target_token, occurrences, tokens, span, allow_self_reference,
+            excluded=excluded
+        )
+        if min_freq is not None:
+            _drop_rare_bigrams((wfd, bfd, pos_pivot, dist), min_freq)
+        pos_pivot.finalize()
+        dist.finalize()
+
+        finder = cls(wfd, bfd, pos=pos_pivot, dist=dist, window_size=window_size)
+        if excluded or min_freq is not None:
+            finder._filtered = True
+        elif words is not None:
+            finder._init_stream(pivot_token, target_token, span, allow_self_reference, words)
+        return finder
 
-                            if (w1, w2) in pos_pivot:
-                                if w2_index not in pos_pivot:
-                                    pos_pivot[(w1, w2)].append(w2_index)
-                            else:
-                                pos_pivot[(w1, w2)].append(w2_index)
-                    else:
-                        continue
+    @classmethod
+    def _from_encoded(
+            cls, pivot_token, target_token, corpus, span, allow_self_reference, excluded=None, min_freq=None
+    ):
+        """Count pivot/target bigrams on the token IDs of an ``EncodedCorpus``,
+        keeping the counts keyed by the token IDs.
+        """
+        pivot_ids = corpus.encode(pivot_token)
+        target_ids = corpus.encode(target_token)
+        relevant = set(pivot_ids) | set(target_ids)
+        relevant.discard(corpus.token_id(None))
+        occurrences = corpus.occurrences(relevant)
+        ids = corpus.ids
+        counts = (FreqDist(), FreqDist(), PositionStore(), PositionStore())
+        _count_pivot_target(
+            counts, pivot_ids, target_ids, occurrences, [ids[i] for i in occurrences], span, allow_self_reference,
+            excluded=corpus.encode(excluded or ())
+        )
+        if min_freq is not None:
+            _drop_rare_bigrams(counts, min_freq)
+
+        wfd, bfd, pos_pivot, dist = counts
+        pos_pivot.finalize()
+        dist.finalize()
+
+        finder = cls(wfd, bfd, pos=pos_pivot, dist=dist, window_size=_window_size(span))
+        finder.vocabulary = corpus.vocabulary
+        if excluded or min_freq is not None:
+            finder._filtered = True
+        else:
+            finder._init_stream(pivot_token, target_token, span, allow_self_reference, corpus)
+        return finder
+
+    def _init_stream(self, pivot_token, target_token, span, allow_self_reference, words):
+        """Remember the query and the edges of ``words``, so that the counts
+        can later be extended with ``update`` and ``merge``.
+        """
+        overlap = self.window_size - 1
+        self._query = (pivot_token, target_token, span, allow_self_reference)
+        self._length = len(words)
+        self._tail = list(words[max(0, len(words) - overlap):])
+        # the length and first window_size - 1 tokens of every document
+        self._segments = [(len(words), list(words[:overlap]))]
+
+    def _check_stream(self, other=None):
+        if getattr(self, "_filtered", False):
+            raise ValueError(
+                "Filtered finders cannot be updated or merged; apply the filters after the last update"
+            )
+        if getattr(self, "_query", None) is None:
+            raise ValueError(
+                "Only finders built with from_words or from_index can be updated"
+            )
+        if other is not None:
+            other._check_stream()
+            if (
+                set(other._query[0]) != set(self._query[0])
+                or set(other._query[1]) != set(self._query[1])
+                or tuple(other._query[2]) != tuple(self._query[2])
+                or other._query[3] is not self._query[3]
+            ):
+                raise ValueError("Cannot combine finders built for different queries")
+
+    def update(self, words):
+        """Extend the counts with ``words``, which follow the words this
+        finder was built from.  Bigrams spanning the previous last words and
+        the new words are counted without re-reading the earlier words, and
+        positions in ``pos`` continue from the end of the earlier words.
+        """
+        self._check_stream()
+        pivot_token, target_token, span, allow_self_reference = self._query
+        self.merge(
+            type(self).from_words(pivot_token, target_token, words, span, allow_self_reference)
+        )
 
-                dist[(w1, w2)].append(abs(w1_index - w2_index))
+    def merge(self, other):
+        """Add the counts of ``other``, a finder for the same query built from
+        the words that follow the words of this finder.  The result is the
+        same as building a single finder from all of the words, though
+        bigrams may be listed in a different order.
+        """
+        self._check_stream(other)
+        # token IDs are only meaningful within one corpus
+        self._decode_counts()
+        other = other._decoded()
+        offset = self._length
+
+        # Windows starting in the last words of this finder were cut short
+        # at its end; count them again now that the next words are known.
+        cut = self._count_tail(self._tail, [], offset)
+        full = self._count_tail(self._tail, _leading_words(other._segments, self.window_size - 1), offset)
+        for ngram, count in cut[1].items():
+            self.ngram_fd[ngram] -= count
+        for ngram, positions in cut[2].items():
+            self.pos.truncate(ngram, len(self.pos[ngram]) - len(positions))
+        for ngram, distances in cut[3].items():
+            self.dist.truncate(ngram, len(self.dist[ngram]) - len(distances))
+        for ngram, count in full[1].items():
+            self.ngram_fd[ngram] += count
+        for ngram, positions in full[2].items():
+            self.pos.extend(ngram, positions)
+        for ngram, distances in full[3].items():
+            self.dist.extend(ngram, distances)
+
+        for w, count in other.word_fd.items():
+            self.word_fd[w] += count
+        for ngram, count in other.ngram_fd.items():
+            self.ngram_fd[ngram] += count
+        for ngram, positions in other.pos.items():
+            self.pos.extend(ngram, [p + offset for p in positions])
+        for ngram, distances in other.dist.items():
+            self.dist.extend(ngram, distances)
+
+        for ngram in [ngram for ngram, count in self.ngram_fd.items() if not count]:
+            del self.ngram_fd[ngram]
+        for ngram in [ngram for ngram, positions in self.pos.items() if not positions]:
+            self.pos.discard(ngram)
+        for ngram in [ngram for ngram, distances in self.dist.items() if not distances]:
+            self.dist.discard(ngram)
+
+        overlap = self.window_size - 1
+        self._tail = (self._tail + other._tail)[max(0, len(self._tail) + len(other._tail) - overlap):]
+        self._length += other._length
+        self._segments.extend(other._segments)
+        self.N = self.word_fd.N()
+
+    def remove(self, expired):
+        """Remove the counts of ``expired``, the finder of the first document
+        that was merged into this one, as when sliding a time window over a
+        stream of documents.  Positions in ``pos`` are shifted to start at
+        the first remaining word.
+
+        The counts and position lists are the same as those of a finder built
+        from the remaining words, though bigrams may be listed in a different
+        order.
+        """
+        self._check_stream(expired)
+        if len(self._segments) < 2 or len(expired._segments) != 1 or self._segments[0] != expired._segments[0]:
+            raise ValueError("Only the first merged document can be removed")
+        self._decode_counts()
+        expired = expired._decoded()
+        pivot_token = set(self._query[0])
+        offset = expired._length
+        overlap = self.window_size - 1
+
+        # windows starting in the last words of expired and reaching into
+        # the remaining words
+        head = _leading_words(self._segments[1:], overlap)
+        cut = self._count_tail(expired._tail, [], offset)
+        full = self._count_tail(expired._tail, head, offset)
+        # the number of leading entries of each list that belong to expired
+        n_pos = _list_lengths(expired.pos, full[2], cut[2])
+        n_dist = _list_lengths(expired.dist, full[3], cut[3])
+
+        for w, count in expired.word_fd.items():
+            _decrement(self.word_fd, w, count)
+        for ngram, count in expired.ngram_fd.items():
+            _decrement(self.ngram_fd, ngram, count)
+        for ngram, count in full[1].items():
+            _decrement(self.ngram_fd, ngram, count - cut[1][ngram])
+
+        pos = PositionStore()
+        for ngram, positions in self.pos.items():
+            if ngram[0] in pivot_token:
+                # pivot positions are unique and increasing
+                n = bisect_left(positions, offset)
+            else:
+                n = n_pos[ngram]
+            if n < len(positions):
+                pos.extend(ngram, [p - offset for p in positions[n:]])
+        dist = PositionStore()
+        for ngram, distances in self.dist.items():
+            if n_dist[ngram] < len(distances):
+                dist.extend(ngram, distances[n_dist[ngram]:])
+        self.pos = pos
+        self.dist = dist
 
-        return cls(wfd, bfd, pos=pos_pivot, dist=dist, window_size=window_size)
+        self._length -= offset
+        self._tail = self._tail[max(0, len(self._tail) - self._length):]
+        del self._segments[0]
+        self.N = self.word_fd.N()
+
+    def _decode_counts(self):
+        """Keys the counts of this finder by tokens rather than token IDs."""
+        if self.vocabulary is not None:
+            vars(self).update(vars(self._decoded()))
+            del self.vocabulary
+
+    def _count_tail(self, tail, head, offset):
+        """Returns the ``(word_fd, ngram_fd, pos, dist)`` counts of bigrams
+        whose first word is in ``tail``, the words ending at ``offset``, and
+        whose second word is in ``tail`` or ``head``, the words starting at
+        ``offset``.
+        """
+        pivot_token, target_token, span, allow_self_reference = self._query
+        counts = (FreqDist(), FreqDist(), PositionStore(), PositionStore())
+        occurrences, tokens, n_first = _scan_occurrences(
+            tail + head, pivot_token, target_token, offset - len(tail), len(tail)
+        )
+        _count_pivot_target(
+            counts, pivot_token, target_token, occurrences, tokens, span, allow_self_reference, n_first
+        )
+        return counts
 
     def score_ngram(self, score_fn, w1, w2):
         """
         Returns the score for a given bigram using the given scoring
         function.  Following Church and Hanks (1990), counts are scaled by
-        a factor of 1/(window_size - 1).
+        a factor of 1/(window_size - 1).  The words are token IDs if the
+        finder was built from an ``EncodedCorpus``.
         """
         n_all = self.N
         n_ii = self.ngram_fd[(w1, w2)] / (self.window_size - 1.0)
@@ -245,6 +1107,409 @@ class BigramCollocationFinder(AbstractCollocationFinder):
         return score_fn(n_ii, (n_ix, n_xi), n_all)
 
 
+def _window_size(span):
+    window_size = max(span) + 1
+
+    if window_size < 2:
+        raise ValueError("Specify window_size at least 2")
+    return window_size
+
+
+def _decrement(fd, key, count):
+    if fd[key] > count:
+        fd[key] -= count
+    else:
+        del fd[key]
+
+
+def _decode_keys(counts, vocabulary, decoded):
+    """Copies ``counts``, keyed by token IDs or tuples of token IDs, into
+    ``decoded`` keyed by the corresponding tokens, and returns it.
+    """
+    for key, value in counts.items():
+        if isinstance(key, tuple):
+            decoded[tuple(vocabulary[i] for i in key)] = value
+        else:
+            decoded[vocabulary[key]] = value
+    return decoded
+
+
+def _leading_words(segments, n):
+    """Returns the first ``n`` words of the documents whose ``(length,
+    first words)`` are listed in ``segments``, or all of them if there are
+    fewer.
+    """
+    head = []
+    for length, segment_head in segments:
+        head.extend(segment_head)
+        if len(head) >= n:
+            break
+    return head[:n]
+
+
+def _list_lengths(lists, added, removed):
+    """Returns, for each key, the length of its list in ``lists`` and
+    ``added`` less that in ``removed``.
+    """
+    lengths = defaultdict(int)
+    for values, sign in ((lists, 1), (added, 1), (removed, -1)):
+        for key, value in values.items():
+            lengths[key] += sign * len(value)
+    return lengths
+
+
+def _scan_occurrences(words, pivot_token, target_token, offset=0, stop=None):
+    """Returns the positions (starting from ``offset``) of the pivot and
+    target tokens in ``words``, the token at each of these positions, and
+    how many of them fall within the first ``stop`` words.
+    """
+    relevant = set(pivot_token) | set(target_token)
+    relevant.discard(None)
+    occurrences = []
+    tokens = []
+    for i, w in enumerate(words):
+        if w in relevant:
+            occurrences.append(offset + i)
+            tokens.append(w)
+    if stop is None:
+        n_first = len(occurrences)
+    else:
+        n_first = bisect_left(occurrences, offset + stop)
+    return occurrences, tokens, n_first
+
+
+def _count_pivot_target(
+        counts, pivot_token, target_token, occurrences, tokens, span, allow_self_reference, n_first=None,
+        excluded=None
+):
+    """Add the pivot/target bigram counts to ``counts``, a tuple of
+    ``(word_fd, ngram_fd, pos, dist)``, given the sorted positions of every
+    pivot or target token and the token found at each position.
+
+    Only bigrams whose first word is one of the first ``n_first`` occurrences
+    are counted, and none with a word in ``excluded``.
+
+    If an ``Instrumentation`` is active, the time spent is added to its
+    ``counting`` stage, and the windows scanned and bigrams counted to its
+    ``windows`` and ``bigrams`` counters.
+    """
+    wfd, bfd, pos_pivot, dist = counts
+    stats = current_instrumentation()
+    if stats is not None:
+        start = perf_counter()
+        n_bigrams = bfd.N()
+    window_size = _window_size(span)
+
+    pivot_token = set(pivot_token)
+    target_token = set(target_token)
+    excluded = set(excluded or ())
+    pivot_partners = pivot_token - excluded
+    target_partners = target_token - excluded
+    n_occurrences = len(occurrences)
+    if n_first is None:
+        n_first = n_occurrences
+
+    for k in range(n_first):
+        w1_index = occurrences[k]
+        w1 = tokens[k]
+
+        wfd[w1] += 1
+
+        if w1 in excluded:
+            continue
+
+        w1_is_pivot_token = w1 in pivot_token
+        if w1_is_pivot_token:
+            partners = target_partners
+            max_dist = span[1]
+        else:
+            partners = pivot_partners
+            max_dist = span[0]
+
+        # only the pivot/target occurrences inside the window can pair up
+        j = k + 1
+        while j < n_occurrences and occurrences[j] - w1_index < window_size:
+            w2_index = occurrences[j]
+            w2 = tokens[j]
+            j += 1
+
+            if w2 == w1 and allow_self_reference is False:
+                continue
+            if w2 not in partners:
+                continue
+
+            i = w2_index - w1_index
+            if i <= max_dist:
+                bfd[(w1, w2)] += 1
+
+                if w1_is_pivot_token:
+                    # positions are visited in increasing order, so a
+                    # duplicate can only be the last recorded position
+                    pos_pivot.append_unique((w1, w2), w1_index)
+                else:
+                    pos_pivot.append((w1, w2), w2_index)
+
+            dist.append((w1, w2), i)
+
+    if stats is not None:
+        stats.add_time("counting", perf_counter() - start)
+        stats.count("windows", n_first)
+        stats.count("bigrams", bfd.N() - n_bigrams)
+
+
+def _drop_rare_bigrams(counts, min_freq):
+    """Removes the bigrams counted less than ``min_freq`` times from the
+    ``(word_fd, ngram_fd, pos, dist)`` counts.
+    """
+    wfd, bfd, pos_pivot, dist = counts
+    for ngram in [ngram for ngram, count in bfd.items() if count < min_freq]:
+        del bfd[ngram]
+    for store in (pos_pivot, dist):
+        for ngram in [ngram for ngram in store if bfd[ngram] < min_freq]:
+            store.discard(ngram)
+
+
+def _count_bigram_shard(pivot_token, target_token, words, offset, stop, span, allow_self_reference):
+    """Count the pivot/target bigrams whose first word is among the first
+    ``stop`` of ``words``, which start at position ``offset`` of the corpus.
+    """
+    counts = (FreqDist(), FreqDist(), PositionStore(), PositionStore())
+    occurrences, tokens, n_first = _scan_occurrences(words, pivot_token, target_token, offset, stop)
+    _count_pivot_target(
+        counts, pivot_token, target_token, occurrences, tokens, span, allow_self_reference, n_first
+    )
+    return counts
+
+
+def _binomial(n, k):
+    """Returns the number of ways of choosing k of n items."""
+    if k < 0 or k > n:
+        return 0
+    return _math.factorial(n) // (_math.factorial(k) * _math.factorial(n - k))
+
+
+def _count_window_prefixes(words, window_size, n):
+    """Counts in a single pass the ngrams found by pairing each word with
+    every combination of n - 1 of the window_size - 1 words following it,
+    as the trigram and quadgram finders do.
+
+    Returns a FreqDist of words and FreqDists of the 2- to n-word prefixes of
+    these ngrams, where a combination stops at the first padding (or None)
+    word it reaches.  Each prefix is counted once for every combination
+    it begins, and each word once for every combination in its window.
+    """
+    words = list(words)
+    span = window_size - 1
+    padded = words + [None] * span
+    # weights[m][s] combinations begin with an m-word prefix ending at slot s
+    weights = [[_binomial(span - s, n - m) for s in range(window_size)] for m in range(n + 1)]
+    word_weight = weights[1][0]
+    word_counts = defaultdict(int)
+    prefix_counts = [defaultdict(int) for m in range(2, n + 1)]
+    counts2, counts3 = prefix_counts[:2]
+    counts4 = prefix_counts[2] if n > 3 else None
+
+    for i, w1 in enumerate(words):
+        if w1 is None:
+            continue
+        word_counts[w1] += word_weight
+        window = padded[i: i + window_size]
+        for a in range(1, window_size):
+            weight = weights[2][a]
+            if not weight:
+                break
+            w2 = window[a]
+            if w2 is None:
+                continue
+            counts2[(w1, w2)] += weight
+            for b in range(a + 1, window_size):
+                weight = weights[3][b]
+                if not weight:
+                    break
+                w3 = window[b]
+                if w3 is None:
+                    continue
+                counts3[(w1, w2, w3)] += weight
+                if counts4 is None:
+                    continue
+                for c in range(b + 1, window_size):
+                    w4 = window[c]
+                    if w4 is not None:
+                        counts4[(w1, w2, w3, w4)] += 1
+
+    return [FreqDist(word_counts)] + [FreqDist(counts) for counts in prefix_counts]
+
+
+def _project(ngram_fd, *indices):
+    """Returns a FreqDist for each tuple of ``indices``, counting the words at
+    those indices of each ngram in ``ngram_fd``.
+    """
+    getters = [itemgetter(*i) for i in indices]
+    projections = [defaultdict(int) for i in indices]
+    for ngram, count in ngram_fd.items():
+        for getter, counts in zip(getters, projections):
+            counts[getter(ngram)] += count
+    return [FreqDist(counts) for counts in projections]
+
+
+_STORE_MAGIC = b"NLTKMACF"
+_STORE_VERSION = 1
+
+
+def _save_finder(finder, path):
+    """Writes the counts of ``finder`` to ``path``: the magic bytes, the
+    length of a JSON header, the header, and then each array of the header
+    aligned to 8 bytes.
+    """
+    token_ids = {}
+    arrays = []
+
+    def add(values):
+        arrays.append(values)
+        return len(arrays) - 1
+
+    header = {
+        "version": _STORE_VERSION,
+        "class": type(finder).__name__,
+        "byteorder": sys.byteorder,
+        "attributes": {},
+        "freqdists": {},
+        "lists": {},
+    }
+    for name, value in sorted(vars(finder).items()):
+        if name.startswith("_"):
+            continue
+        if isinstance(value, FreqDist):
+            items = list(value.items())
+            width, ids = _encode_store_keys([key for key, count in items], token_ids)
+            header["freqdists"][name] = {
+                "width": width,
+                "keys": add(ids),
+                "counts": add(array("q", [count for key, count in items])),
+            }
+        elif isinstance(value, Mapping):
+            items = list(value.items())
+            width, ids = _encode_store_keys([key for key, v in items], token_ids)
+            offsets = array("q", [0])
+            values = array("q")
+            for key, v in items:
+                values.extend(v)
+                offsets.append(len(values))
+            header["lists"][name] = {
+                "width": width,
+                "keys": add(ids),
+                "offsets": add(offsets),
+                "values": add(values),
+            }
+        else:
+            header["attributes"][name] = value
+
+    for token in token_ids:
+        if not isinstance(token, str):
+            raise TypeError("Only finders of str tokens can be saved, not %r" % (token,))
+    encoded = [token.encode("utf-8") for token in token_ids]
+    header["strings"] = add(array("q", _itertools.accumulate([0] + [len(e) for e in encoded])))
+    header["string_data"] = add(array("B", b"".join(encoded)))
+
+    header["arrays"] = []
+    offset = 0
+    for values in arrays:
+        header["arrays"].append({"typecode": values.typecode, "offset": offset, "length": len(values)})
+        offset += _aligned(len(values) * values.itemsize)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(_STORE_MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(bytes(_aligned(len(header_bytes)) - len(header_bytes)))
+        for values in arrays:
+            data = values.tobytes()
+            f.write(data)
+            f.write(bytes(_aligned(len(data)) - len(data)))
+
+
+def _load_finder(cls, path, use_mmap):
+    """Reads a finder of class ``cls`` written by ``_save_finder``."""
+    with open(path, "rb") as f:
+        if use_mmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+    view = memoryview(buffer)
+    if bytes(view[:8]) != _STORE_MAGIC:
+        raise ValueError("%s is not a saved collocation finder" % path)
+    (header_length,) = struct.unpack("<Q", view[8:16])
+    header = json.loads(bytes(view[16: 16 + header_length]).decode("utf-8"))
+    if header["version"] != _STORE_VERSION:
+        raise ValueError("Unsupported collocation finder file version %r" % header["version"])
+    if header["class"] != cls.__name__:
+        raise ValueError("%s holds a %s, not a %s" % (path, header["class"], cls.__name__))
+    data_start = 16 + _aligned(header_length)
+    swap = header["byteorder"] != sys.byteorder
+
+    def get(index):
+        spec = header["arrays"][index]
+        start = data_start + spec["offset"]
+        values = view[start: start + spec["length"] * array(spec["typecode"]).itemsize]
+        values = values.cast(spec["typecode"])
+        if swap:
+            values = array(spec["typecode"], values)
+            values.byteswap()
+        return values
+
+    string_offsets = get(header["strings"]).tolist()
+    string_data = get(header["string_data"])
+    tokens = [
+        bytes(string_data[start:stop]).decode("utf-8")
+        for start, stop in zip(string_offsets, string_offsets[1:])
+    ]
+
+    finder = cls.__new__(cls)
+    for name, value in header["attributes"].items():
+        setattr(finder, name, value)
+    for name, spec in header["freqdists"].items():
+        keys = _decode_store_keys(get(spec["keys"]), spec["width"], tokens)
+        setattr(finder, name, FreqDist(dict(zip(keys, get(spec["counts"]).tolist()))))
+    for name, spec in header["lists"].items():
+        keys = _decode_store_keys(get(spec["keys"]), spec["width"], tokens)
+        offsets = get(spec["offsets"])
+        values = get(spec["values"])
+        if not use_mmap:
+            values = array("l", values)
+        setattr(finder, name, PositionStore._from_csr(keys, offsets.tolist(), values))
+    return finder
+
+
+def _aligned(n):
+    """Rounds ``n`` up to a multiple of 8."""
+    return -(-n // 8) * 8
+
+
+def _encode_store_keys(keys, token_ids):
+    """Returns the number of tokens in each of ``keys`` (0 for single tokens)
+    and an array of their IDs in ``token_ids``, which new tokens are added
+    to.
+    """
+    ids = array("i")
+    width = 0
+    for key in keys:
+        if isinstance(key, tuple):
+            width = len(key)
+            ids.extend(token_ids.setdefault(w, len(token_ids)) for w in key)
+        else:
+            ids.append(token_ids.setdefault(key, len(token_ids)))
+    return width, ids
+
+
+def _decode_store_keys(ids, width, tokens):
+    """Returns the keys encoded by ``_encode_store_keys``."""
+    words = map(tokens.__getitem__, ids.tolist())
+    if not width:
+        return list(words)
+    return list(zip(*[words] * width))
+
+
 class TrigramCollocationFinder(AbstractCollocationFinder):
     """A tool for the finding and ranking of trigram collocations or other
     association measures. It is often useful to use from_words() rather than
@@ -263,31 +1528,26 @@ class TrigramCollocationFinder(AbstractCollocationFinder):
         self.bigram_fd = bigram_fd
 
     @classmethod
-    def from_words(cls, words, window_size=3):
+    def from_words(cls, words, window_size=3, min_freq=None, word_filter=None, stopwords=None):
         """Construct a TrigramCollocationFinder for all trigrams in the given
         sequence.
+
+        The filters of ``apply_filters`` may be given to be applied to the
+        trigrams as soon as they are counted.  The other counts are not
+        filtered, since they are the marginals used to score the remaining
+        trigrams.
         """
         if window_size < 3:
             raise ValueError("Specify window_size at least 3")
-
-        wfd = FreqDist()
-        wildfd = FreqDist()
-        bfd = FreqDist()
-        tfd = FreqDist()
-        for window in ngrams(words, window_size, pad_right=True):
-            w1 = window[0]
-            if w1 is None:
-                continue
-            for w2, w3 in _itertools.combinations(window[1:], 2):
-                wfd[w1] += 1
-                if w2 is None:
-                    continue
-                bfd[(w1, w2)] += 1
-                if w3 is None:
-                    continue
-                wildfd[(w1, w3)] += 1
-                tfd[(w1, w2, w3)] += 1
-        return cls(wfd, bfd, wildfd, tfd)
+        if isinstance(words, EncodedCorpus):
+            finder = cls.from_words(words.ids, window_size)
+            finder.vocabulary = words.vocabulary
+        else:
+            wfd, bfd, tfd = _count_window_prefixes(words, window_size, 3)
+            wildfd, = _project(tfd, (0, 2))
+            finder = cls(wfd, bfd, wildfd, tfd)
+        finder.apply_filters(min_freq, word_filter, stopwords)
+        return finder
 
     def bigram_finder(self):
         """Constructs a bigram collocation finder with the bigram and unigram
@@ -334,39 +1594,23 @@ class QuadgramCollocationFinder(AbstractCollocationFinder):
         self.ixii = ixii
 
     @classmethod
-    def from_words(cls, words, window_size=4):
+    def from_words(cls, words, window_size=4, min_freq=None, word_filter=None, stopwords=None):
+        """Construct a QuadgramCollocationFinder for all quadgrams in the
+        given sequence, applying any filters of ``apply_filters`` to the
+        quadgrams as soon as they are counted.
+        """
         if window_size < 4:
             raise ValueError("Specify window_size at least 4")
-        ixxx = FreqDist()
-        iiii = FreqDist()
-        ii = FreqDist()
-        iii = FreqDist()
-        ixi = FreqDist()
-        ixxi = FreqDist()
-        iixi = FreqDist()
-        ixii = FreqDist()
-
-        for window in ngrams(words, window_size, pad_right=True):
-            w1 = window[0]
-            if w1 is None:
-                continue
-            for w2, w3, w4 in _itertools.combinations(window[1:], 3):
-                ixxx[w1] += 1
-                if w2 is None:
-                    continue
-                ii[(w1, w2)] += 1
-                if w3 is None:
-                    continue
-                iii[(w1, w2, w3)] += 1
-                ixi[(w1, w3)] += 1
-                if w4 is None:
-                    continue
-                iiii[(w1, w2, w3, w4)] += 1
-                ixxi[(w1, w4)] += 1
-                ixii[(w1, w3, w4)] += 1
-                iixi[(w1, w2, w4)] += 1
-
-        return cls(ixxx, iiii, ii, iii, ixi, ixxi, iixi, ixii)
+        if isinstance(words, EncodedCorpus):
+            finder = cls.from_words(words.ids, window_size)
+            finder.vocabulary = words.vocabulary
+        else:
+            ixxx, ii, iii, iiii = _count_window_prefixes(words, window_size, 4)
+            ixi, = _project(iii, (0, 2))
+            ixxi, iixi, ixii = _project(iiii, (0, 3), (0, 1, 3), (0, 2, 3))
+            finder = cls(ixxx, iiii, ii, iii, ixi, ixxi, iixi, ixii)
+        finder.apply_filters(min_freq, word_filter, stopwords)
+        return finder
 
     def score_ngram(self, score_fn, w1, w2, w3, w4):
         n_all = self.N
@@ -452,6 +1696,9 @@ if __name__ == "__main__":
     demo(scorer, compare_scorer)
 
 __all__ = [
+    "CollocationIndex",
+    "EncodedCorpus",
+    "PositionStore",
     "BigramCollocationFinder",
     "TrigramCollocationFinder",
     "QuadgramCollocationFinder",
@@ -0,0 +1,280 @@
+# Natural Language Toolkit: Asynchronous concordance service
+#
+# Copyright (C) 2001-2021 NLTK Project
+# URL: <http://nltk.org/>
+# For license information, see LICENSE.TXT
+
+"""
+An asyncio interface to ``find_concordance`` and the pivot/target
+collocation finder, for servers answering many concurrent lookups.
+
+The CPU-bound work runs in a bounded pool of worker processes, so that it
+does not block the event loop::
+
+    async with ConcordanceService(max_workers=4) as service:
+        service.add_corpus('doc', original_tokens, cleaned_tokens)
+        lines = await service.find_concordance('doc', ['minority'], ['asian'], (3, 3), (1, 10))
+
+Each corpus is sent to a worker once: the worker then keeps the tokens, a
+``CollocationIndex`` and the alignment of the cleaned tokens with the
+original ones, and every query only visits the occurrences of its pivot and
+target tokens.
+
+Identical queries in flight at the same time are computed once.  Queries
+waiting for a worker are started in order of ``priority`` (lower values
+first), and no more than ``max_pending`` distinct queries are accepted at
+a time: further callers wait until a query completes.  Cancelling a caller
+cancels its query if no other caller is waiting for it and it has not
+started yet.
+"""
+
+import asyncio
+import collections
+import heapq
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from nltkma.collocations import BigramCollocationFinder, CollocationIndex
+from nltkma.text import DetachedConcordanceLines, find_concordance
+from nltkma.util import map_cleaned_corpus_array
+
+
+class ConcordanceService:
+    """
+    Run concordance and collocation queries against registered corpora in
+    a pool of worker processes.
+
+    :param max_workers: the number of queries run at the same time, and
+        the number of worker processes if no ``executor`` is given
+    :param max_pending: the number of distinct queries accepted before
+        callers have to wait
+    :param executor: a ``concurrent.futures`` executor to run the queries
+        in, which is left running by ``close``
+    """
+
+    def __init__(self, max_workers=None, max_pending=64, executor=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._own_executor = executor is None
+        self._executor = executor
+        self._directory = None
+        self._remove_directory = None
+        self._corpora = {}
+        # the number of pending queries against each corpus file, and the
+        # files to remove once they have none
+        self._users = collections.Counter()
+        self._removed = set()
+        self._generation = itertools.count()
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._queue = []
+        self._running = 0
+        self._slots = None
+
+    def add_corpus(self, name, original_tokens, cleaned_tokens, tokens_no_stamming=None,
+                   tokens_are_lowercase=False):
+        """
+        Register a corpus under ``name``, replacing any corpus of that name.
+        The arguments are as for ``find_concordance``, and
+        ``tokens_no_stamming`` defaults to ``cleaned_tokens``.  The corpus is
+        pickled to a temporary directory for the workers to load, which is
+        removed by ``close`` or when the service is garbage collected.
+        """
+        if tokens_no_stamming is None:
+            tokens_no_stamming = cleaned_tokens
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="nltkma-concordance-")
+            # remove the corpora even if the service is not closed
+            self._remove_directory = weakref.finalize(self, shutil.rmtree, self._directory, ignore_errors=True)
+        path = os.path.join(self._directory, "corpus-%d.pickle" % next(self._generation))
+        with open(path, "wb") as fp:
+            pickle.dump((list(original_tokens), list(cleaned_tokens), list(tokens_no_stamming),
+                         bool(tokens_are_lowercase)), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        if name in self._corpora:
+            self.remove_corpus(name)
+        self._corpora[name] = (path, original_tokens)
+
+    def remove_corpus(self, name):
+        """
+        Forget the corpus registered under ``name``.  Its file is removed
+        once the queries already submitted against it are done.
+        """
+        path, _ = self._corpora.pop(name)
+        if self._users[path]:
+            self._removed.add(path)
+        else:
+            del self._users[path]
+            os.remove(path)
+
+    async def find_concordance(self, corpus, pivot_tokens, target_tokens, span, context,
+                               allow_self_reference=False, ignore_punctuation=True, priority=0):
+        """
+        Return the ``find_concordance`` lines of a query against the corpus
+        registered as ``corpus``.
+
+        :rtype: list(ConcordanceLine)
+        """
+        path, original_tokens = self._corpora[corpus]
+        args = (path, tuple(pivot_tokens), tuple(target_tokens), tuple(span), tuple(context),
+                bool(allow_self_reference), bool(ignore_punctuation))
+        lines = await self._submit(("concordance",) + args, _concordance_job, args, priority)
+        return lines.lines(original_tokens)
+
+    async def collocations(self, corpus, pivot_tokens, target_tokens, span, allow_self_reference=False,
+                           priority=0):
+        """
+        Return the ``BigramCollocationFinder`` of the pivot and target tokens
+        in the cleaned tokens of the corpus registered as ``corpus``.  The
+        finder is shared by the callers of identical concurrent queries.
+
+        :rtype: BigramCollocationFinder
+        """
+        path, _ = self._corpora[corpus]
+        args = (path, tuple(pivot_tokens), tuple(target_tokens), tuple(span), bool(allow_self_reference))
+        return await self._submit(("collocations",) + args, _collocations_job, args, priority)
+
+    def stats(self):
+        """
+        Return the numbers of ``running`` queries and of ``pending`` ones,
+        including the running ones.
+
+        :rtype: dict
+        """
+        return {"running": self._running, "pending": len(self._jobs)}
+
+    async def _submit(self, key, fn, args, priority):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        job = self._jobs.get(key)
+        if job is None:
+            await self._slots.acquire()
+            # an identical query may have been submitted while waiting
+            job = self._jobs.get(key)
+            if job is None:
+                job = self._jobs[key] = _Job(asyncio.get_event_loop().create_future(), fn, args, priority)
+                self._users[args[0]] += 1
+                heapq.heappush(self._queue, (priority, next(self._sequence), key, job))
+                self._dispatch()
+            else:
+                self._slots.release()
+        if priority < job.priority and not job.started:
+            job.priority = priority
+            heapq.heappush(self._queue, (priority, next(self._sequence), key, job))
+
+        job.waiters += 1
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            if job.waiters == 0 and not job.started and not job.future.done():
+                job.future.cancel()
+                self._release(key, job)
+            raise
+
+    def _dispatch(self):
+        loop = asyncio.get_event_loop()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers)
+        while self._running < self.max_workers and self._queue:
+            _, _, key, job = heapq.heappop(self._queue)
+            if job.started or job.future.done():
+                # a stale entry of a re-prioritized or cancelled query
+                continue
+            job.started = True
+            self._running += 1
+            future = loop.run_in_executor(self._executor, job.fn, *job.args)
+            future.add_done_callback(lambda future, key=key, job=job: self._finished(key, job, future))
+
+    def _finished(self, key, job, future):
+        self._running -= 1
+        self._release(key, job)
+        if not job.future.done():
+            if future.cancelled():
+                job.future.cancel()
+            elif future.exception() is not None:
+                job.future.set_exception(future.exception())
+            else:
+                job.future.set_result(future.result())
+        self._dispatch()
+
+    def _release(self, key, job):
+        if self._jobs.get(key) is job:
+            del self._jobs[key]
+            self._slots.release()
+            path = job.args[0]
+            self._users[path] -= 1
+            if not self._users[path]:
+                del self._users[path]
+                if path in self._removed:
+                    self._removed.discard(path)
+                    os.remove(path)
+
+    def close(self):
+        """Shut the worker processes down and remove the registered corpora."""
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown()
+        self._executor = None
+        self._corpora.clear()
+        self._removed.clear()
+        if self._remove_directory is not None:
+            self._remove_directory()
+        self._directory = self._remove_directory = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class _Job:
+    __slots__ = ("future", "fn", "args", "priority", "waiters", "started")
+
+    def __init__(self, future, fn, args, priority):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.waiters = 0
+        self.started = False
+
+
+# The corpora loaded by a worker process, by path, least recently used first.
+_worker_corpora = {}
+_WORKER_CORPORA_SIZE = 8
+
+
+def _load_corpus(path):
+    corpus = _worker_corpora.pop(path, None)
+    if corpus is None:
+        with open(path, "rb") as fp:
+            original_tokens, cleaned_tokens, tokens_no_stamming, tokens_are_lowercase = pickle.load(fp)
+        corpus = (
+            original_tokens,
+            CollocationIndex(cleaned_tokens),
+            map_cleaned_corpus_array(original_tokens, tokens_no_stamming, tokens_are_lowercase),
+            tokens_are_lowercase,
+        )
+    _worker_corpora[path] = corpus
+    while len(_worker_corpora) > _WORKER_CORPORA_SIZE:
+        del _worker_corpora[next(iter(_worker_corpora))]
+    return corpus
+
+
+def _concordance_job(path, pivot_tokens, target_tokens, span, context, allow_self_reference, ignore_punctuation):
+    original_tokens, index, index_mapping, tokens_are_lowercase = _load_corpus(path)
+    lines = find_concordance(pivot_tokens, target_tokens, span, context, original_tokens, index, None,
+                             allow_self_reference, ignore_punctuation, tokens_are_lowercase,
+                             index_mapping=index_mapping)
+    # the lines are sent back without the tokens, which the service has
+    return DetachedConcordanceLines(lines)
+
+
+def _collocations_job(path, pivot_tokens, target_tokens, span, allow_self_reference):
+    _, index, _, _ = _load_corpus(path)
+    return BigramCollocationFinder.from_index(pivot_tokens, target_tokens, index, span, allow_self_reference)
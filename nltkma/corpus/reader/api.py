@@ -158,6 +158,53 @@ class CorpusReader:
         """
         return self._fileids
 
+    def build_block_indexes(self, fileids=None, views="words", background=False):
+        """
+        Read the corpus views returned by this reader's ``views`` method for
+        each of ``fileids`` to their end, so that their toknum/filepos
+        mappings are saved to ``StreamBackedCorpusView.index_directory``
+        for later views of the same files.  See ``build_block_indexes``.
+
+        :param views: The name of the method returning the views to index.
+        :rtype: threading.Thread or None
+        """
+        if fileids is None:
+            fileids = self.fileids()
+        elif isinstance(fileids, str):
+            fileids = [fileids]
+        method = getattr(self, views)
+        return build_block_indexes((method(fileid) for fileid in fileids), background)
+
+    def iter_parallel(self, views="words", fileids=None, workers=None, processes=False, max_pending=None):
+        """
+        Generate the items of this reader's ``views`` method for each of
+        ``fileids``, in order, reading the files in a pool of ``workers``
+        threads, or processes if ``processes`` is true.  Each file is read
+        by one worker, and at most ``max_pending`` files (by default, twice
+        the number of workers) are read ahead of the file being generated.
+
+        Threads hand the items back in chunks, and stop reading ahead while
+        two chunks of a file are waiting, so the memory used is bounded
+        whatever the size of the files; see ``iterate_in_pool``.  Worker
+        processes send back each file as a whole, so then the memory used
+        grows with the size of the ``max_pending`` largest files.  Also,
+        this reader is pickled and sent to the worker processes along with
+        each fileid, so it must be picklable.
+
+            >>> from nltkma.corpus import gutenberg # doctest: +SKIP
+            >>> sum(1 for word in gutenberg.iter_parallel('words', workers=4, processes=True)) # doctest: +SKIP
+            2621613
+
+        :param views: The name of the method returning the items of a file.
+        :rtype: iter
+        """
+        if fileids is None:
+            fileids = self.fileids()
+        elif isinstance(fileids, str):
+            fileids = [fileids]
+        return iterate_in_pool(_read_file, ((self, views, fileid) for fileid in fileids), workers, processes,
+                               max_pending)
+
     def abspath(self, fileid):
         """
         Return the absolute path for the given file.
@@ -259,6 +306,10 @@ class CorpusReader:
 ######################################################################
 
 
+def _read_file(reader, views, fileid):
+    return getattr(reader, views)(fileid)
+
+
 class CategorizedCorpusReader:
     """
     A mixin class used to aid in the implementation of corpus readers
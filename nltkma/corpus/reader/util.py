@@ -8,16 +8,24 @@
 
 import os
 import bisect
+import hashlib
+import json
 import re
 import tempfile
+import threading
 import pickle
+import queue
+import types
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import reduce
+from itertools import count
 from xml.etree import ElementTree
 
 from nltkma.tokenize import wordpunct_tokenize
 from nltkma.internals import slice_bounds
 from nltkma.data import PathPointer, FileSystemPathPointer, ZipFilePathPointer
-from nltkma.data import SeekableUnicodeStreamReader
+from nltkma.data import SeekableUnicodeStreamReader, seekable_unicode_stream
 from nltkma.util import AbstractLazySequence, LazySubsequence, LazyConcatenation
 
 ######################################################################
@@ -116,9 +124,36 @@ class StreamBackedCorpusView(AbstractLazySequence):
        start_toknum is the token index of the first token in the block;
        end_toknum is the token index of the first token not in the
        block; and tokens is a list of the tokens in the block.
+
+    If ``index_directory`` is set, either on this class or for one view,
+    the toknum/filepos mapping and the length of a view are saved to that
+    directory once the view has been read to its end, and views of the same
+    file read in the same way start from the saved mapping, even in another
+    process.  Saved mappings are keyed by the path, modification time and
+    size of the file, the start position and encoding, and a description
+    of the block reader and of the state of the view.  Views whose block
+    reader cannot be described, such as a function defined inside another
+    function, are never saved.  See ``build_block_indexes`` to build the
+    mappings of many views ahead of time.
+
+    Besides the most recently read block, a view may keep more blocks in
+    a ``BlockCache``, which can be shared by many views.  With a block
+    cache, a view may also read ahead: when it reads a block from the file,
+    it goes on to read the ``readahead`` blocks that follow into the cache.
     """
 
-    def __init__(self, fileid, block_reader=None, startpos=0, encoding="utf8"):
+    index_directory = None
+    """The directory where the toknum/filepos mappings are saved, or None."""
+
+    block_cache = None
+    """The ``BlockCache`` keeping the blocks read by the view, or None."""
+
+    readahead = 0
+    """The number of blocks read into the block cache after each block that
+    is read from the file."""
+
+    def __init__(self, fileid, block_reader=None, startpos=0, encoding="utf8", index_directory=None,
+                 block_cache=None, readahead=None):
         """
         Create a new corpus view, based on the file ``fileid``, and
         read with ``block_reader``.  See the class documentation
@@ -136,9 +171,29 @@ class StreamBackedCorpusView(AbstractLazySequence):
             read the file's contents.  If no encoding is specified,
             then the file's contents will be read as a non-unicode
             string (i.e., a str).
+
+        :param index_directory: The directory where the toknum/filepos
+            mapping of this view is saved, if not the class's
+            ``index_directory``.
+
+        :param block_cache: The ``BlockCache`` of this view, if not the
+            class's ``block_cache``.
+
+        :param readahead: The number of blocks read ahead into the block
+            cache, if not the class's ``readahead``.
         """
         if block_reader:
             self.read_block = block_reader
+        if index_directory is not None:
+            self.index_directory = index_directory
+        if block_cache is not None:
+            self.block_cache = block_cache
+        if readahead is not None:
+            self.readahead = readahead
+        # Identifies the blocks of this view in a block cache.
+        self._block_cache_key = next(_view_keys)
+        # The path of the saved toknum/filepos mapping, once looked up.
+        self._index_path = None
         # Initialize our toknum/filepos mapping.
         self._toknum = [0]
         self._filepos = [startpos]
@@ -206,7 +261,7 @@ class StreamBackedCorpusView(AbstractLazySequence):
         if isinstance(self._fileid, PathPointer):
             self._stream = self._fileid.open(self._encoding)
         elif self._encoding:
-            self._stream = SeekableUnicodeStreamReader(
+            self._stream = seekable_unicode_stream(
                 open(self._fileid, "rb"), self._encoding
             )
         else:
@@ -232,6 +287,8 @@ class StreamBackedCorpusView(AbstractLazySequence):
         self.close()
 
     def __len__(self):
+        if self._len is None and self._index_path is None:
+            self._load_block_index()
         if self._len is None:
             # iterate_from() sets self._len when it reaches the end
             # of the file:
@@ -264,9 +321,97 @@ class StreamBackedCorpusView(AbstractLazySequence):
             except StopIteration as e:
                 raise IndexError("index out of range") from e
 
+    def _block_index_path(self):
+        """
+        Return the path of the file where the toknum/filepos mapping of
+        this view is saved, or False if it is not saved.
+        """
+        if self._index_path is None:
+            self._index_path = False
+            if self.index_directory is not None:
+                key = self._block_index_key()
+                if key is not None:
+                    self._index_key = key
+                    digest = hashlib.blake2b(json.dumps(key).encode("utf8"), digest_size=16).hexdigest()
+                    self._index_path = os.path.join(self.index_directory, "blocks-%s.json" % digest)
+        return self._index_path
+
+    def _block_index_key(self):
+        """
+        Return a description of the file and of the way it is read, which
+        identifies the toknum/filepos mapping of this view, or None if
+        there is none.
+        """
+        fileid = self._fileid
+        entry = None
+        if isinstance(fileid, ZipFilePathPointer):
+            path, entry = fileid.zipfile.filename, fileid.entry
+        elif isinstance(fileid, FileSystemPathPointer):
+            path = fileid.path
+        elif isinstance(fileid, str):
+            path = fileid
+        else:
+            return None
+        state = {
+            name: value
+            for name, value in vars(self).items()
+            if name not in _BASE_VIEW_ATTRIBUTES
+        }
+        try:
+            stat = os.stat(path)
+            return [
+                os.path.abspath(path),
+                entry,
+                stat.st_mtime_ns,
+                stat.st_size,
+                self._filepos[0],
+                self._encoding,
+                _describe(type(self)),
+                _describe(self.read_block),
+                _describe(state),
+            ]
+        except (OSError, ValueError):
+            return None
+
+    def _load_block_index(self):
+        """
+        Replace the toknum/filepos mapping of this view by the saved one,
+        if there is one.
+        """
+        path = self._block_index_path()
+        if not path or self._len is not None:
+            return
+        try:
+            with open(path, encoding="utf8") as infile:
+                index = json.load(infile)
+        except (OSError, ValueError):
+            return
+        if index.get("key") == self._index_key:
+            self._toknum = index["toknum"]
+            self._filepos = index["filepos"]
+            self._len = index["len"]
+
+    def _save_block_index(self):
+        """Save the complete toknum/filepos mapping of this view."""
+        path = self._block_index_path()
+        if not path:
+            return
+        index = {"key": self._index_key, "toknum": self._toknum, "filepos": self._filepos, "len": self._len}
+        try:
+            os.makedirs(self.index_directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf8") as outfile:
+                json.dump(index, outfile)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
     # If we wanted to be thread-safe, then this method would need to
     # do some locking.
     def iterate_from(self, start_tok):
+        if self._index_path is None:
+            self._load_block_index()
+
         # Start by feeding from the cache, if possible.
         if self._cache[0] <= start_tok < self._cache[1]:
             for tok in self._cache[2][start_tok - self._cache[0] :]:
@@ -295,23 +440,25 @@ class StreamBackedCorpusView(AbstractLazySequence):
             self._len = 0
 
         # Each iteration through this loop, we read a single block
-        # from the stream.
+        # from the stream, or from the block cache.
         while filepos < self._eofpos:
-            # Read the next block.
-            self._stream.seek(filepos)
-            self._current_toknum = toknum
-            self._current_blocknum = block_index
-            tokens = self.read_block(self._stream)
-            assert isinstance(tokens, (tuple, list, AbstractLazySequence)), (
-                "block reader %s() should return list or tuple."
-                % self.read_block.__name__
-            )
+            block_cache = self.block_cache
+            block = None
+            if block_cache is not None:
+                block = block_cache.get(self._block_cache_key, filepos)
+            if block is None:
+                # Read the next block.
+                if self._stream is None:
+                    self._open()
+                self._stream.seek(filepos)
+                tokens, new_filepos = self._read_next_block(filepos, toknum, block_index)
+                if block_cache is not None:
+                    block_cache.put(self._block_cache_key, filepos, tokens, new_filepos)
+                    self._read_ahead(block_cache, new_filepos, toknum + len(tokens),
+                                     block_index + (1 if tokens else 0))
+            else:
+                tokens, new_filepos = block
             num_toks = len(tokens)
-            new_filepos = self._stream.tell()
-            assert new_filepos > filepos, (
-                "block reader %s() should consume at least 1 byte (filepos=%d)"
-                % (self.read_block.__name__, filepos)
-            )
 
             # Update our cache.
             self._cache = (toknum, toknum + num_toks, list(tokens))
@@ -335,7 +482,9 @@ class StreamBackedCorpusView(AbstractLazySequence):
 
             # If we reached the end of the file, then update self._len
             if new_filepos == self._eofpos:
-                self._len = toknum + num_toks
+                if self._len is None:
+                    self._len = toknum + num_toks
+                    self._save_block_index()
             # Generate the tokens in this block (but skip any tokens
             # before start_tok).  Note that between yields, our state
             # may be modified.
@@ -355,6 +504,40 @@ class StreamBackedCorpusView(AbstractLazySequence):
         # We should have reached EOF once we're out of the while loop.
         self.close()
 
+    def _read_next_block(self, filepos, toknum, block_index):
+        """
+        Read the block of tokens at the current position of the stream,
+        ``filepos``, which is block ``block_index`` and starts with token
+        ``toknum``, and return it with the file position that follows it.
+        """
+        self._current_toknum = toknum
+        self._current_blocknum = block_index
+        tokens = self.read_block(self._stream)
+        assert isinstance(tokens, (tuple, list, AbstractLazySequence)), (
+            "block reader %s() should return list or tuple."
+            % self.read_block.__name__
+        )
+        new_filepos = self._stream.tell()
+        assert new_filepos > filepos, (
+            "block reader %s() should consume at least 1 byte (filepos=%d)"
+            % (self.read_block.__name__, filepos)
+        )
+        return tokens, new_filepos
+
+    def _read_ahead(self, block_cache, filepos, toknum, block_index):
+        """
+        Read up to ``readahead`` blocks into ``block_cache``, starting at
+        the current position of the stream, ``filepos``.
+        """
+        for _ in range(self.readahead):
+            if filepos >= self._eofpos or block_cache.get(self._block_cache_key, filepos, count=False):
+                break
+            tokens, new_filepos = self._read_next_block(filepos, toknum, block_index)
+            block_cache.put(self._block_cache_key, filepos, tokens, new_filepos)
+            filepos = new_filepos
+            toknum += len(tokens)
+            block_index += 1 if tokens else 0
+
     # Use concat for these, so we can use a ConcatenatedCorpusView
     # when possible.
     def __add__(self, other):
@@ -370,6 +553,261 @@ class StreamBackedCorpusView(AbstractLazySequence):
         return concat([self] * count)
 
 
+# The attributes set by StreamBackedCorpusView.__init__, which are left out
+# of the description of the state of a view.
+_BASE_VIEW_ATTRIBUTES = frozenset([
+    "read_block", "index_directory", "_index_path", "_index_key", "_toknum", "_filepos", "_encoding", "_len",
+    "_fileid", "_stream", "_current_toknum", "_current_blocknum", "_eofpos", "_cache", "block_cache", "readahead",
+    "_block_cache_key",
+])
+
+_view_keys = count()
+
+
+class BlockCache:
+    """
+    A cache of blocks of tokens read by corpus views, which may be shared
+    by many views.  Once the cached blocks hold more than ``max_tokens``
+    tokens, or span more than ``max_bytes`` bytes of their files, the least
+    recently used blocks are evicted.  The cache may be used from several
+    threads.
+
+    :ivar hits: The number of blocks found in the cache.
+    :ivar misses: The number of blocks looked up but not found.
+    :ivar evictions: The number of blocks evicted.
+    """
+
+    def __init__(self, max_tokens=100000, max_bytes=None):
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        # {(view key, filepos): (tokens, end filepos)}, least recently
+        # used first
+        self._blocks = {}
+        self._num_tokens = 0
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, view_key, filepos, count=True):
+        """
+        Return the ``(tokens, end_filepos)`` of the block read by the view
+        identified by ``view_key`` at ``filepos``, or None.  If ``count`` is
+        false, the lookup is not counted as a hit or miss, and does not
+        mark the block as recently used.
+        """
+        key = (view_key, filepos)
+        with self._lock:
+            if not count:
+                return self._blocks.get(key)
+            block = self._blocks.pop(key, None)
+            if block is None:
+                self.misses += 1
+                return None
+            self._blocks[key] = block
+            self.hits += 1
+            return block
+
+    def put(self, view_key, filepos, tokens, end_filepos):
+        """Add the block of ``tokens`` read at ``filepos``."""
+        key = (view_key, filepos)
+        block = (list(tokens), end_filepos)
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._num_tokens -= len(old[0])
+                self._num_bytes -= old[1] - filepos
+            self._blocks[key] = block
+            self._num_tokens += len(block[0])
+            self._num_bytes += end_filepos - filepos
+            # evict the least recently used blocks, but keep the new one
+            while len(self._blocks) > 1 and (
+                (self.max_tokens is not None and self._num_tokens > self.max_tokens)
+                or (self.max_bytes is not None and self._num_bytes > self.max_bytes)
+            ):
+                (_, start), (tokens, end) = next(iter(self._blocks.items()))
+                del self._blocks[_, start]
+                self._num_tokens -= len(tokens)
+                self._num_bytes -= end - start
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Return the numbers of ``hits``, ``misses`` and ``evictions``, and
+        the numbers of ``blocks``, ``tokens`` and ``bytes`` cached.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "blocks": len(self._blocks), "tokens": self._num_tokens, "bytes": self._num_bytes}
+
+    def clear(self):
+        """Remove all blocks from the cache."""
+        with self._lock:
+            self._blocks.clear()
+            self._num_tokens = self._num_bytes = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+
+def _describe(value, depth=3):
+    """
+    Return a JSON-compatible description of ``value``, which is the same
+    for values that read a corpus file in the same way.
+
+    :raise ValueError: If ``value`` cannot be described, e.g. because it
+        is a function defined inside another function.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_describe(item, depth) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(json.dumps(_describe(item, depth)) for item in value)
+    if isinstance(value, dict):
+        return sorted([_describe(key, depth), _describe(item, depth)] for key, item in value.items())
+    if isinstance(value, type(re.compile(""))):
+        return ["re", value.pattern, value.flags]
+    if isinstance(value, types.MethodType):
+        return [_describe(value.__func__, depth), _describe(value.__self__, depth)]
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        name = "%s.%s" % (value.__module__, value.__qualname__)
+        if "<" in name:
+            raise ValueError("Cannot describe %r" % value)
+        return name
+    if isinstance(value, PathPointer):
+        return _describe(type(value)) + ":" + str(value)
+    if depth > 0 and hasattr(value, "__dict__"):
+        return [_describe(type(value)), _describe(vars(value), depth - 1)]
+    raise ValueError("Cannot describe %r" % value)
+
+
+def build_block_indexes(views, background=False):
+    """
+    Read each of the corpus ``views`` to its end, so that the
+    toknum/filepos mapping of each ``StreamBackedCorpusView`` is saved to
+    its ``index_directory``.  ``ConcatenatedCorpusView`` views are indexed
+    piece by piece.
+
+    :param background: If true, the views are read in a daemon thread,
+        which is returned; the views should then not be used by the caller.
+    :rtype: threading.Thread or None
+    """
+
+    def build():
+        for view in views:
+            pieces = view._pieces if isinstance(view, ConcatenatedCorpusView) else [view]
+            for piece in pieces:
+                len(piece)
+                piece.close()
+
+    if not background:
+        build()
+        return None
+    thread = threading.Thread(target=build, name="build_block_indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+def iterate_in_pool(fn, tasks, workers=None, processes=False, max_pending=None, chunk_size=1024):
+    """
+    Generate the items of the iterables returned by ``fn(*task)`` for each
+    of ``tasks``, in order, calling ``fn`` in a pool of ``workers`` threads
+    (by default, one per CPU), or processes if ``processes`` is true.  At
+    most ``max_pending`` tasks (by default, twice the number of workers)
+    are submitted ahead of the one whose items are being generated.  When
+    the generator is closed, the tasks that have not started are cancelled.
+
+    With threads, each task sends its items back in chunks of
+    ``chunk_size`` items, and waits while two of its chunks are not yet
+    generated, so that at most ``(3 * max_pending + 1) * chunk_size``
+    items are held in memory however long the iterables are.  Worker processes
+    send back all the items of a task at once, so then the memory used is
+    bounded by ``max_pending`` whole results.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max(1, max_pending or 2 * workers)
+    if processes:
+        yield from _iterate_in_processes(fn, tasks, workers, max_pending)
+        return
+
+    stop = threading.Event()
+    pending = deque()
+    with ThreadPoolExecutor(workers) as executor:
+        try:
+            for task in tasks:
+                channel = queue.Queue(2)
+                pending.append((executor.submit(_send_chunks, fn, task, channel, chunk_size, stop), channel))
+                if len(pending) >= max_pending:
+                    yield from _receive_chunks(*pending.popleft())
+            while pending:
+                yield from _receive_chunks(*pending.popleft())
+        finally:
+            # stop the running tasks at their next chunk
+            stop.set()
+            for future, _ in pending:
+                future.cancel()
+
+
+def _iterate_in_processes(fn, tasks, workers, max_pending):
+    pending = deque()
+    with ProcessPoolExecutor(workers) as executor:
+        try:
+            for task in tasks:
+                pending.append(executor.submit(_list_items, fn, task))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _list_items(fn, task):
+    return list(fn(*task))
+
+
+def _send_chunks(fn, task, channel, chunk_size, stop):
+    """
+    Put the items of ``fn(*task)`` in ``channel`` in lists of ``chunk_size``
+    items, followed by None, unless ``stop`` is set first.
+    """
+
+    def send(chunk):
+        while not stop.is_set():
+            try:
+                channel.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        chunk = []
+        for item in fn(*task):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                if not send(chunk):
+                    return
+                chunk = []
+        if chunk:
+            send(chunk)
+    finally:
+        send(None)
+
+
+def _receive_chunks(future, channel):
+    while True:
+        chunk = channel.get()
+        if chunk is None:
+            break
+        yield from chunk
+    # raise the error that ended the task early, if any
+    future.result()
+
+
 class ConcatenatedCorpusView(AbstractLazySequence):
     """
     A 'view' of a corpus file that joins together one or more
@@ -377,11 +815,22 @@ class ConcatenatedCorpusView(AbstractLazySequence):
     one file handle is left open at any time.
     """
 
-    def __init__(self, corpus_views):
+    def __init__(self, corpus_views, block_cache=None):
+        """
+        :param block_cache: A ``BlockCache`` to share between the corpus
+            subviews, or None to leave their block caches unchanged.
+        """
         self._pieces = corpus_views
         """A list of the corpus subviews that make up this
         concatenation."""
 
+        if block_cache is not None:
+            for piece in corpus_views:
+                if isinstance(piece, ConcatenatedCorpusView):
+                    ConcatenatedCorpusView(piece._pieces, block_cache)
+                else:
+                    piece.block_cache = block_cache
+
         self._offsets = [0]
         """A list of offsets, indicating the index at which each
         subview begins.  In particular::
@@ -32,6 +32,7 @@ to a local file.
 """
 
 import functools
+import mmap
 import textwrap
 from io import BytesIO, TextIOWrapper
 import os
@@ -40,8 +41,15 @@ import sys
 import zipfile
 import codecs
 import pickle
+import threading
+import time
+import types
+import weakref
 
 from abc import ABCMeta, abstractmethod
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from gzip import GzipFile, WRITE as GZ_WRITE
 
 from urllib.request import urlopen, url2pathname
@@ -324,7 +332,7 @@ class FileSystemPathPointer(PathPointer, str):
     def open(self, encoding=None):
         stream = open(self._path, "rb")
         if encoding is not None:
-            stream = SeekableUnicodeStreamReader(stream, encoding)
+            stream = seekable_unicode_stream(stream, encoding)
         return stream
 
     def file_size(self):
@@ -461,11 +469,192 @@ class ZipFilePathPointer(PathPointer):
 # Access Functions
 ######################################################################
 
-# Don't use a weak dictionary, because in the common case this
+class ResourceCache:
+    """
+    A cache of the resources loaded by ``load()``, keyed by their
+    ``(resource_url, format)``.  By default it keeps every resource, like
+    a dictionary; the following limits may be set:
+
+      - ``max_bytes``: once the cached resources are estimated to take
+        more than ``max_bytes`` bytes of memory, the least recently used
+        ones are evicted.
+      - ``max_entries``: the maximum number of cached resources.
+      - ``weak_threshold``: resources estimated to take at least this
+        many bytes are only weakly referenced (if they support weak
+        references), so that they stay cached as long as they are used
+        elsewhere, without counting against ``max_bytes``.
+      - ``ttl``: the number of seconds after which a cached resource is
+        loaded again; either a number for all formats, or a dictionary
+        from formats to numbers.
+
+    The cache may be used from several threads.
+
+    :ivar hits: The number of resources found in the cache.
+    :ivar misses: The number of resources looked up but not found.
+    :ivar evictions: The number of resources evicted to stay in the limits.
+    :ivar expirations: The number of resources found too old to be used.
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None, weak_threshold=None, ttl=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.weak_threshold = weak_threshold
+        self.ttl = ttl
+        # {key: (value or weak reference, is weak, size, expiry time)},
+        # least recently used first
+        self._entries = {}
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Return the resource cached under ``key``, or ``default``.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                value, weak, size, expires = entry
+                if weak:
+                    value = value()
+                if expires is not None and time.monotonic() >= expires:
+                    self.expirations += 1
+                    value = None
+                if value is not None:
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return value
+                self._num_bytes -= size
+            self.misses += 1
+            return default
+
+    def __setitem__(self, key, value):
+        """
+        Cache ``value`` under ``key``, which is a ``(resource_url, format)``
+        tuple.
+        """
+        # estimating the size walks the whole resource, so it is only
+        # done if a limit depends on it
+        if self.max_bytes is None and self.weak_threshold is None:
+            size = 0
+        else:
+            size = _estimate_size(value)
+        weak = self.weak_threshold is not None and size >= self.weak_threshold
+        if weak:
+            try:
+                reference = weakref.ref(value)
+            except TypeError:
+                weak = False
+        ttl = self.ttl.get(key[1]) if isinstance(self.ttl, dict) else self.ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        entry = (reference if weak else value, weak, 0 if weak else size, expires)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._num_bytes -= old[2]
+            self._entries[key] = entry
+            self._num_bytes += entry[2]
+            # evict the least recently used resources, but keep the new one
+            while len(self._entries) > 1 and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self._num_bytes > self.max_bytes)
+            ):
+                old_key = next(iter(self._entries))
+                self._num_bytes -= self._entries.pop(old_key)[2]
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Return the numbers of ``hits``, ``misses``, ``evictions`` and
+        ``expirations``, and the number of ``entries`` cached and the
+        estimated ``bytes`` of those that are not weakly referenced
+        (which are only estimated if ``max_bytes`` or ``weak_threshold``
+        is set).
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "expirations": self.expirations, "entries": len(self._entries), "bytes": self._num_bytes}
+
+    def clear(self):
+        """Remove all resources from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _estimate_size(value):
+    """
+    Return an estimate of the number of bytes of memory used by ``value``
+    and the objects it refers to through containers and attributes.
+    Objects referred to more than once are counted once.
+    """
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        if isinstance(obj, (str, bytes, bytearray, int, float)):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        if hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+        for name in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, name):
+                stack.append(getattr(obj, name))
+    return size
+
+
+# Don't use weak references by default, because in the common case this
 # causes a lot more reloading that necessary.
-_resource_cache = {}
-"""A dictionary used to cache resources so that they won't
-   need to be loaded more than once."""
+_resource_cache = ResourceCache()
+"""The cache of resources, so that they won't need to be loaded more
+   than once.  Any mapping may be used instead, see ``set_resource_cache()``."""
+
+
+def set_resource_cache(cache):
+    """
+    Use ``cache`` to cache the resources loaded by ``load()``, and return
+    the cache used so far.  ``cache`` is a ``ResourceCache`` or any other
+    mapping, such as a dictionary, which is never evicted from.
+    """
+    global _resource_cache
+    old_cache, _resource_cache = _resource_cache, cache
+    return old_cache
+
+
+def warm_cache(resource_urls, workers=None, **kwargs):
+    """
+    Load the given resources into the cache in parallel threads, e.g.
+    when a server starts, and return a dictionary from each URL to its
+    resource.  The keyword arguments are passed to ``load()``.
+
+    :param workers: the number of threads (by default, as many as the
+        ``concurrent.futures`` default)
+    :raise: the first error raised loading any of the resources, after
+        the others are loaded
+    """
+    kwargs["cache"] = True
+    resource_urls = list(resource_urls)
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(load, resource_url, **kwargs) for resource_url in resource_urls]
+    return {resource_url: future.result() for resource_url, future in zip(resource_urls, futures)}
 
 
 def find(resource_name, paths=None):
@@ -700,7 +889,8 @@ def load(
     :type cache: bool
     :param cache: If true, add this resource to a cache.  If load()
         finds a resource in its cache, then it will return it from the
-        cache rather than loading it.
+        cache rather than loading it.  The cache keeps every resource
+        unless it is replaced with ``set_resource_cache()``.
     :type verbose: bool
     :param verbose: If true, print a message when loading a resource.
         Messages are not displayed when a resource is retrieved from
@@ -904,6 +1094,11 @@ class LazyLoader:
         # __class__ to something new:
         return getattr(self, attr)
 
+    def __reduce__(self):
+        # Pickle the path rather than the state, which __getattr__ would
+        # otherwise try to load before _path is restored.
+        return LazyLoader, (self._path,)
+
     def __repr__(self):
         self.__load()
         # This looks circular, but its not, since __load() changes our
@@ -1419,6 +1614,282 @@ class SeekableUnicodeStreamReader:
         return None
 
 
+class MappedUnicodeStreamReader(SeekableUnicodeStreamReader):
+    """
+    A ``SeekableUnicodeStreamReader`` for UTF-8 encoded files, which
+    memory-maps the file instead of decoding it through a byte buffer.
+
+    Since the reader always knows the byte offset of the next character,
+    ``tell()`` needs no backtracking, ``readline()`` finds the end of
+    the line with a search over the mapped bytes, and only the bytes that
+    are returned are decoded.
+
+    In addition to the byte offsets of ``seek()`` and ``tell()``,
+    ``char_seek()`` and ``char_tell()`` move to and return character
+    offsets (not counting the byte order marker).  They are computed
+    from a table of the byte offsets of every ``CHECKPOINT_INTERVAL``
+    characters, which is built as far as it is needed.
+
+    :param stream: a file opened in binary mode, which has a ``fileno()``
+    :raise ValueError: if the file cannot be memory-mapped, e.g. if it
+        is empty
+    """
+
+    CHECKPOINT_INTERVAL = 16384
+    """The number of characters between two offsets of the checkpoint table."""
+
+    @py3_data
+    def __init__(self, stream, encoding="utf8", errors="strict"):
+        if codecs.lookup(encoding).name != "utf-8" or errors != "strict":
+            raise ValueError("MappedUnicodeStreamReader only reads strict utf-8")
+        self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.stream = stream
+        self.encoding = encoding
+        self.errors = errors
+        self.decode = codecs.utf_8_decode
+        self._size = len(self._map)
+        self._pos = 0
+        self._bom = len(codecs.BOM_UTF8) if self._map[:3] == codecs.BOM_UTF8 else None
+        self._checkpoints = [self._bom or 0]
+        self._checkpoints_done = False
+
+    # /////////////////////////////////////////////////////////////////
+    # Read methods
+    # /////////////////////////////////////////////////////////////////
+
+    def read(self, size=None):
+        """
+        Read up to ``size`` bytes, decode them and return the resulting
+        unicode string.  If ``size`` ends in the middle of a character,
+        then the read stops before that character (or after it, if it is
+        the first one).
+
+        :param size: The maximum number of bytes to read.  If not
+            specified, then read as many bytes as possible.
+        :type size: int
+        :rtype: unicode
+        """
+        if size == 0:
+            return ""
+        start = self._start()
+        end = self._size if size is None else self._limit(start, size)
+        self._pos = max(start, end)
+        return self._decode(start, end)
+
+    def discard_line(self):
+        end = self._map.find(b"\n", self._pos)
+        self._pos = self._size if end < 0 else end + 1
+
+    def readline(self, size=None):
+        """
+        Read a line of text, decode it and return the resulting unicode
+        string.  Lines end as for ``str.splitlines()``.
+
+        :param size: The maximum number of bytes to read.  If no
+            newline is encountered before ``size`` bytes have been read,
+            then the returned value may not be a complete line of text.
+        :type size: int
+        """
+        start = self._start()
+        if size is None:
+            # the common case of a line ending with '\n' alone
+            end = self._map.find(b"\n", start, start + 8192) + 1
+            if end:
+                line = self.decode(self._view[start:end], "strict", True)[0]
+                if len(line.splitlines()) == 1:
+                    self._pos = end
+                    return line
+        stop = self._size if size is None else self._limit(start, size)
+        window = 8192
+        while True:
+            # Look for a newline in a growing window, so that a file
+            # using other line terminators is not searched to its end
+            # for every line.
+            end = self._map.find(b"\n", start, min(stop, start + window))
+            found = end >= 0
+            if found:
+                end += 1
+            else:
+                end = min(stop, self._char_boundary(start + window))
+                if self._map[end - 1 : end + 1] == b"\r\n":
+                    end += 1
+            chars = self._decode(start, end)
+            lines = chars.splitlines(True)
+            if len(lines) > 1:
+                line = lines[0]
+                self._pos = start + len(line.encode("utf8"))
+                return line
+            if found or end >= stop or chars.splitlines()[0] != chars:
+                self._pos = max(start, end)
+                return chars
+            window *= 2
+
+    def __del__(self):
+        # the stream is not ours if the file could not be mapped
+        if getattr(self, "_map", None) is not None and not self.closed:
+            self.close()
+
+    # /////////////////////////////////////////////////////////////////
+    # Pass-through methods & properties
+    # /////////////////////////////////////////////////////////////////
+
+    def close(self):
+        """
+        Close the memory map and the underlying stream.
+        """
+        self._view.release()
+        self._map.close()
+        self.stream.close()
+
+    # /////////////////////////////////////////////////////////////////
+    # Seek and tell
+    # /////////////////////////////////////////////////////////////////
+
+    def seek(self, offset, whence=0):
+        """
+        Move the stream to a new byte offset.
+
+        :param offset: A byte count offset.
+        :param whence: If 0, then the offset is from the start of the
+            file, and if 2, then the offset is from the end of the file.
+        """
+        if whence == 1:
+            raise ValueError(
+                "Relative seek is not supported for "
+                "MappedUnicodeStreamReader -- consider "
+                "using char_seek_forward() instead."
+            )
+        self._pos = offset + (self._size if whence == 2 else 0)
+
+    def char_seek_forward(self, offset):
+        """
+        Move the read pointer forward by ``offset`` characters.
+        """
+        if offset < 0:
+            raise ValueError("Negative offsets are not supported")
+        self._pos = self._char_offset(self._pos, offset)
+
+    def tell(self):
+        """
+        Return the byte offset of the next character to be read.
+        """
+        return self._pos
+
+    def char_seek(self, offset):
+        """
+        Move the read pointer to the character at ``offset``, counted
+        from the start of the text.
+        """
+        if offset < 0:
+            raise ValueError("Negative offsets are not supported")
+        interval = self.CHECKPOINT_INTERVAL
+        checkpoints = self._checkpoints
+        while len(checkpoints) <= offset // interval and self._add_checkpoint():
+            pass
+        index = min(offset // interval, len(checkpoints) - 1)
+        self._pos = self._char_offset(checkpoints[index], offset - index * interval)
+
+    def char_tell(self):
+        """
+        Return the offset of the next character to be read, counted from
+        the start of the text.
+        """
+        checkpoints = self._checkpoints
+        pos = min(self._pos, self._size)
+        while checkpoints[-1] <= pos and self._add_checkpoint():
+            pass
+        index = bisect_right(checkpoints, pos) - 1
+        if index < 0:
+            return 0
+        return index * self.CHECKPOINT_INTERVAL + len(self._decode(checkpoints[index], pos))
+
+    # /////////////////////////////////////////////////////////////////
+    # Helper methods
+    # /////////////////////////////////////////////////////////////////
+
+    def _start(self):
+        """
+        Return the byte offset where the next read starts, skipping past
+        the byte order marker.
+        """
+        if self._bom and self._pos == 0:
+            self._pos = self._bom
+        return self._pos
+
+    def _char_boundary(self, pos):
+        """
+        Return ``pos``, or the start of the character it is in the middle of.
+        """
+        if pos >= self._size:
+            return self._size
+        stop = max(pos - 3, 0)
+        while pos > stop and 0x80 <= self._map[pos] < 0xC0:
+            pos -= 1
+        return pos
+
+    def _limit(self, start, size):
+        """
+        Return the byte offset where a read of ``size`` bytes from
+        ``start`` ends, which includes at least one character.
+        """
+        end = self._char_boundary(start + size)
+        if end <= start < self._size:
+            end = self._char_offset(start, 1)
+        return end
+
+    def _decode(self, start, end):
+        """
+        Decode the complete characters between two byte offsets, without
+        copying the mapped bytes.
+        """
+        if end <= start:
+            return ""
+        return self.decode(self._view[start:end], "strict", False)[0]
+
+    def _char_offset(self, pos, count):
+        """
+        Return the byte offset ``count`` characters after ``pos``, or the
+        end of the file.
+        """
+        if count == 0:
+            return pos
+        chars = self._decode(pos, pos + 4 * count)
+        return min(pos + len(chars[:count].encode("utf8")), self._size)
+
+    def _add_checkpoint(self):
+        """
+        Add the next offset to the checkpoint table, and return false if
+        there are no more.
+        """
+        if self._checkpoints_done:
+            return False
+        start = self._checkpoints[-1]
+        chars = self._decode(start, start + 4 * self.CHECKPOINT_INTERVAL)
+        if len(chars) < self.CHECKPOINT_INTERVAL:
+            self._checkpoints_done = True
+            return False
+        self._checkpoints.append(start + len(chars[: self.CHECKPOINT_INTERVAL].encode("utf8")))
+        return True
+
+
+def seekable_unicode_stream(stream, encoding, errors="strict"):
+    """
+    Return a seekable unicode reader of the binary ``stream``: a
+    ``MappedUnicodeStreamReader`` if the file is UTF-8 encoded and can be
+    memory-mapped, and a ``SeekableUnicodeStreamReader`` otherwise.
+
+    :rtype: SeekableUnicodeStreamReader
+    """
+    if errors == "strict" and codecs.lookup(encoding).name == "utf-8":
+        try:
+            return MappedUnicodeStreamReader(stream, encoding, errors)
+        except (AttributeError, OSError, ValueError):
+            # not a file, or an empty one
+            pass
+    return SeekableUnicodeStreamReader(stream, encoding, errors)
+
+
 __all__ = [
     "path",
     "PathPointer",
@@ -1433,8 +1904,13 @@ __all__ = [
     "load",
     "show_cfg",
     "clear_cache",
+    "ResourceCache",
+    "set_resource_cache",
+    "warm_cache",
     "LazyLoader",
     "OpenOnDemandZipFile",
     "GzipFileSystemPathPointer",
     "SeekableUnicodeStreamReader",
+    "MappedUnicodeStreamReader",
+    "seekable_unicode_stream",
 ]
@@ -42,6 +42,7 @@ from nltkma.metrics.association import (
     TrigramAssocMeasures,
     QuadgramAssocMeasures,
     ContingencyMeasures,
+    vectorized_measure,
 )
 from nltkma.metrics.spearman import (
     spearman_correlation,
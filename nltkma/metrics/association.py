@@ -23,6 +23,11 @@ _product = lambda s: reduce(lambda x, y: x * y, s)
 
 _SMALL = 1e-20
 
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
 try:
     from scipy.stats import fisher_exact
 except ImportError:
@@ -97,6 +102,28 @@ class NgramAssocMeasures(metaclass=ABCMeta):
                 / (n_all ** (cls._n - 1))
             )
 
+    @classmethod
+    def _vectorized_pmi(cls, *marginals):
+        """The form of ``pmi`` taking NumPy arrays of marginals."""
+        return _np.log2(marginals[NGRAM] * marginals[TOTAL] ** (cls._n - 1)) - _np.log2(
+            _product(marginals[UNIGRAMS])
+        )
+
+    @classmethod
+    def _vectorized_likelihood_ratio(cls, *marginals):
+        """The form of ``likelihood_ratio`` taking NumPy arrays of marginals."""
+        cont = cls._contingency(*marginals)
+        return 2 * sum(
+            obs * _np.log(obs / (exp + _SMALL) + _SMALL)
+            for obs, exp in zip(cont, cls._expected_values(cont))
+        )
+
+    @classmethod
+    def _vectorized_poisson_stirling(cls, *marginals):
+        """The form of ``poisson_stirling`` taking NumPy arrays of marginals."""
+        exp = _product(marginals[UNIGRAMS]) / (marginals[TOTAL] ** (cls._n - 1))
+        return marginals[NGRAM] * (_np.log2(marginals[NGRAM] / exp) - 1)
+
     @staticmethod
     def raw_freq(*marginals):
         """Scores ngrams by their frequency"""
@@ -431,6 +458,41 @@ class QuadgramAssocMeasures(NgramAssocMeasures):
         )
 
 
+# Measures which only use arithmetic operators accept NumPy arrays as they are;
+# the others have a _vectorized_ form using NumPy's logarithms instead.
+_ARITHMETIC_MEASURES = ("raw_freq", "student_t", "chi_sq", "mi_like", "jaccard")
+_LOGARITHMIC_MEASURES = ("pmi", "likelihood_ratio", "poisson_stirling")
+
+_VECTORIZED = {}
+for _measures in (BigramAssocMeasures, TrigramAssocMeasures, QuadgramAssocMeasures):
+    for _name in _ARITHMETIC_MEASURES:
+        _VECTORIZED[getattr(_measures, _name)] = getattr(_measures, _name)
+    for _name in _LOGARITHMIC_MEASURES:
+        _VECTORIZED[getattr(_measures, _name)] = getattr(_measures, "_vectorized_" + _name)
+for _name in ("phi_sq", "dice"):
+    _VECTORIZED[getattr(BigramAssocMeasures, _name)] = getattr(BigramAssocMeasures, _name)
+
+
+def vectorized_measure(score_fn):
+    """
+    Returns a form of the association measure ``score_fn`` which takes NumPy
+    arrays of marginals, scoring many ngrams in one call, or None if numpy is
+    not installed or ``score_fn`` has no such form.  The totals may still be
+    given as a single number.
+
+        >>> from nltkma.metrics import BigramAssocMeasures
+        >>> vectorized_measure(BigramAssocMeasures.fisher) is None
+        True
+    """
+    if _np is None:
+        return None
+    try:
+        return _VECTORIZED.get(score_fn)
+    except TypeError:
+        # unhashable scoring functions
+        return None
+
+
 class ContingencyMeasures:
     """Wraps NgramAssocMeasures classes such that the arguments of association
     measures are contingency table values rather than marginals.
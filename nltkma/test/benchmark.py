@@ -0,0 +1,158 @@
+"""Benchmarks for the concordance and collocation entry points.
+
+Times and memory-profiles ``find_concordance``, the pivot/target
+``BigramCollocationFinder.from_words`` and ``map_cleaned_corpus`` on
+synthetic corpora of increasing size, and writes the results as JSON so
+that runs can be compared across revisions::
+
+    python -m nltkma.test.benchmark --sizes 1e4 1e5 1e6 --output results.json
+
+Each corpus is drawn from a Zipfian vocabulary of ``--vocabulary`` words,
+with punctuation tokens inserted at a rate of ``--punctuation`` and the
+pivot token at a rate of ``--pivot-frequency``.  The cleaned corpus is the
+original one with the punctuation removed.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from nltkma.collocations import BigramCollocationFinder
+from nltkma.text import find_concordance
+from nltkma.util import map_cleaned_corpus
+
+PIVOT = "PIVOT"
+PUNCTUATION = [".", ",", ";", "!", "?"]
+
+
+def synthetic_corpus(n_tokens, vocabulary_size=10000, punctuation=0.1, pivot_frequency=0.001, seed=0):
+    """
+    Generate a corpus of ``n_tokens`` tokens.
+
+    Words are drawn with probabilities following Zipf's law, so the first
+    words of the vocabulary are the most frequent ones.
+
+    :return: the original tokens, the tokens with punctuation removed, and
+        the pivot and target tokens to query
+    :rtype: tuple(list(str), list(str), list(str), list(str))
+    """
+    rng = random.Random(seed)
+    vocabulary = ["w%d" % i for i in range(vocabulary_size)]
+    weights = [1.0 / rank for rank in range(1, vocabulary_size + 1)]
+    original = rng.choices(vocabulary, weights, k=n_tokens)
+    for i in range(n_tokens):
+        r = rng.random()
+        if r < pivot_frequency:
+            original[i] = PIVOT
+        elif r < pivot_frequency + punctuation:
+            original[i] = rng.choice(PUNCTUATION)
+    cleaned = [token for token in original if token not in PUNCTUATION]
+    return original, cleaned, [PIVOT], vocabulary[:10]
+
+
+def measure(fn, repeat=3, memory=True):
+    """
+    Run ``fn`` ``repeat`` times and return the best and mean wall-clock
+    times in seconds.  If ``memory`` is true, ``fn`` is run once more under
+    ``tracemalloc`` to record the peak memory it allocated, in bytes.
+
+    :rtype: dict
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    result = {"best": min(times), "mean": sum(times) / len(times), "repeat": repeat}
+
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(sizes, spans=((5, 5),), contexts=((10, 10),), vocabulary_size=10000, punctuation=0.1,
+                   pivot_frequency=0.001, repeat=3, memory=True, seed=0):
+    """
+    Benchmark the entry points on a synthetic corpus of each of ``sizes``
+    tokens, for each span and, for ``find_concordance``, each context.
+
+    :return: one record per corpus size, entry point and parameters
+    :rtype: list(dict)
+    """
+    results = []
+    for size in sizes:
+        size = int(size)
+        original, cleaned, pivot, target = synthetic_corpus(size, vocabulary_size, punctuation, pivot_frequency, seed)
+        corpus = {"tokens": size, "cleaned_tokens": len(cleaned), "pivots": cleaned.count(PIVOT)}
+
+        def record(name, timing, **params):
+            results.append(dict(corpus, benchmark=name, params=params, **timing))
+
+        record("map_cleaned_corpus",
+               measure(lambda: map_cleaned_corpus(original, cleaned, False), repeat, memory))
+
+        for span in spans:
+            record("BigramCollocationFinder.from_words",
+                   measure(lambda: BigramCollocationFinder.from_words(pivot, target, cleaned, span), repeat, memory),
+                   span=list(span))
+
+            for context in contexts:
+                def concordance():
+                    lines = find_concordance(pivot, target, span, context, original, cleaned, cleaned, False, True,
+                                             False)
+                    # the text of the lines is only joined when it is read
+                    return [line.line for line in lines]
+
+                record("find_concordance", measure(concordance, repeat, memory), span=list(span),
+                       context=list(context))
+    return results
+
+
+def _pair(value):
+    left, _, right = value.partition(",")
+    return int(left), int(right or left)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e4, 1e5, 1e6],
+                        help="corpus sizes in tokens (default: 1e4 1e5 1e6)")
+    parser.add_argument("--spans", nargs="+", type=_pair, default=[(5, 5)], metavar="LEFT,RIGHT")
+    parser.add_argument("--contexts", nargs="+", type=_pair, default=[(10, 10)], metavar="LEFT,RIGHT")
+    parser.add_argument("--vocabulary", type=int, default=10000, help="vocabulary size")
+    parser.add_argument("--punctuation", type=float, default=0.1, help="rate of punctuation tokens")
+    parser.add_argument("--pivot-frequency", type=float, default=0.001, help="rate of pivot tokens")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run_benchmarks(args.sizes, args.spans, args.contexts, args.vocabulary, args.punctuation,
+                                  args.pivot_frequency, args.repeat, not args.no_memory, args.seed),
+    }
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
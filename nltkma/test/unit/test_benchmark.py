@@ -0,0 +1,40 @@
+import json
+
+from nltkma.test import benchmark
+from nltkma.test.benchmark import main, synthetic_corpus
+from nltkma.util import Instrumentation
+
+
+def test_synthetic_corpus():
+    original, cleaned, pivot, target = synthetic_corpus(1000, vocabulary_size=50, punctuation=0.2,
+                                                        pivot_frequency=0.05)
+    assert len(original) == 1000
+    assert cleaned == [token for token in original if token not in '.,;!?']
+    assert pivot[0] in cleaned and all(token in cleaned for token in target[:3])
+
+
+def test_benchmark_report(tmp_path):
+    output = tmp_path / 'results.json'
+    main(['--sizes', '2000', '--spans', '3,3', '--contexts', '5', '--repeat', '1', '--output', str(output)])
+
+    results = json.loads(output.read_text())['results']
+    assert [r['benchmark'] for r in results] == [
+        'map_cleaned_corpus', 'BigramCollocationFinder.from_words', 'find_concordance'
+    ]
+    assert results[2]['params'] == {'span': [3, 3], 'context': [5, 5]}
+    assert all(r['tokens'] == 2000 and r['best'] >= 0 and r['peak_memory'] > 0 for r in results)
+
+
+def test_benchmark_renders_lines(monkeypatch):
+    joined = []
+
+    def measure(fn, repeat=3, memory=True):
+        with Instrumentation() as stats:
+            fn()
+        joined.append(stats.counters.get('characters_joined', 0))
+        return {'best': 0.0}
+
+    monkeypatch.setattr(benchmark, 'measure', measure)
+    benchmark.run_benchmarks([2000], contexts=((5, 5),), repeat=1, memory=False)
+    # the concordance lines are rendered inside the timed function
+    assert joined[0] == joined[1] == 0 and joined[2] > 0
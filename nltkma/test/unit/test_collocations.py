@@ -1,5 +1,8 @@
-from nltkma.collocations import BigramCollocationFinder
-from nltkma.metrics import BigramAssocMeasures
+import pytest
+
+from nltkma.collocations import (BigramCollocationFinder, CollocationIndex, EncodedCorpus, PositionStore,
+                                 QuadgramCollocationFinder, TrigramCollocationFinder)
+from nltkma.metrics import BigramAssocMeasures, TrigramAssocMeasures, vectorized_measure
 
 ## Test bigram counters with discontinuous bigrams and repeated words
 
@@ -125,3 +128,315 @@ def test_bigram_7():
     target_token = ['asian']
 
     b = BigramCollocationFinder.from_words(pivot_token,target_token,corpus_token_cleaned,(3,3),True)
+
+
+def test_bigram_from_index():
+    pivot_tokens = ['numbers', 'landlines']
+    target_tokens = ['calls', 'personal', 'numbers']
+    corpus = ['calls', 'to', '0800', 'numbers', 'are', 'numbers', 'free', 'from', 'from', 'personal', 'mobiles',
+              'personal', 'and', 'landlines']
+    index = CollocationIndex(corpus)
+
+    assert list(index.positions('personal')) == [9, 11]
+    assert index.occurrences(['numbers', 'calls']) == [0, 3, 5]
+
+    for span in [(4, 4), (2, 2), (1, 3)]:
+        for allow_self_reference in [True, False]:
+            expected = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, corpus, span,
+                                                          allow_self_reference)
+            b = BigramCollocationFinder.from_index(pivot_tokens, target_tokens, index, span, allow_self_reference)
+
+            assert list(b.word_fd.items()) == list(expected.word_fd.items())
+            assert list(b.ngram_fd.items()) == list(expected.ngram_fd.items())
+            assert list(b.pos.items()) == list(expected.pos.items())
+            assert list(b.dist.items()) == list(expected.dist.items())
+
+
+def test_bigram_from_words_parallel():
+    pivot_tokens = ['numbers', 'landlines']
+    target_tokens = ['calls', 'personal', 'numbers']
+    corpus = ['calls', 'to', '0800', 'numbers', 'are', 'numbers', 'free', 'from', 'from', 'personal', 'mobiles',
+              'personal', 'and', 'landlines']
+
+    expected = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, corpus, (4, 4), True)
+    for chunk_size in [1, 3, 5, 100]:
+        b = BigramCollocationFinder.from_words_parallel(pivot_tokens, target_tokens, corpus, (4, 4), True,
+                                                        processes=1, chunk_size=chunk_size)
+
+        assert list(b.word_fd.items()) == list(expected.word_fd.items())
+        assert list(b.ngram_fd.items()) == list(expected.ngram_fd.items())
+        assert list(b.pos.items()) == list(expected.pos.items())
+        assert list(b.dist.items()) == list(expected.dist.items())
+
+
+def test_bigram_update_merge_remove():
+    pivot_tokens = ['numbers', 'landlines']
+    target_tokens = ['calls', 'personal', 'numbers']
+    documents = [['calls', 'to', '0800', 'numbers'], ['are', 'numbers', 'free', 'from'],
+                 ['from', 'personal', 'mobiles', 'personal', 'and', 'landlines']]
+
+    def assert_same(b, words):
+        expected = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, words, (4, 4), True)
+        assert b.word_fd == expected.word_fd
+        assert b.ngram_fd == expected.ngram_fd
+        assert dict(b.pos) == dict(expected.pos)
+        assert dict(b.dist) == dict(expected.dist)
+        assert b.N == expected.N
+
+    first = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, documents[0], (4, 4), True)
+    b = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, documents[0], (4, 4), True)
+    b.update(documents[1])
+    assert_same(b, documents[0] + documents[1])
+    b.merge(BigramCollocationFinder.from_words(pivot_tokens, target_tokens, documents[2], (4, 4), True))
+    assert_same(b, documents[0] + documents[1] + documents[2])
+    b.remove(first)
+    assert_same(b, documents[1] + documents[2])
+
+    with pytest.raises(ValueError):
+        b.merge(BigramCollocationFinder.from_words(pivot_tokens, target_tokens, documents[2], (2, 2), True))
+
+
+def test_bigram_merge_short_documents():
+    pivot_tokens = ['a', 'x']
+    target_tokens = ['b', 'c', 'x']
+    documents = [['a'], ['x'], ['b', 'c'], [], ['a', 'b']]
+
+    def finder(words):
+        return BigramCollocationFinder.from_words(pivot_tokens, target_tokens, words, (3, 3), True)
+
+    def assert_same(b, words):
+        expected = finder(words)
+        assert b.word_fd == expected.word_fd
+        assert b.ngram_fd == expected.ngram_fd
+        assert dict(b.pos) == dict(expected.pos)
+        assert dict(b.dist) == dict(expected.dist)
+        assert b.N == expected.N
+
+    for start in range(len(documents) - 1):
+        words = [w for document in documents[start:] for w in document]
+
+        # nested: each document is merged with the merge of all that follow
+        nested = finder(documents[-1])
+        for document in reversed(documents[start:-1]):
+            b = finder(document)
+            b.merge(nested)
+            nested = b
+        assert_same(nested, words)
+
+        chained = finder(documents[start])
+        for document in documents[start + 1:]:
+            chained.merge(finder(document))
+        assert_same(chained, words)
+
+        chained.remove(finder(documents[start]))
+        assert_same(chained, words[len(documents[start]):])
+
+
+@pytest.mark.parametrize('measure', ['raw_freq', 'student_t', 'chi_sq', 'mi_like', 'jaccard', 'pmi',
+                                     'likelihood_ratio', 'poisson_stirling', 'phi_sq', 'dice'])
+def test_bigram_vectorized_scores(measure):
+    pytest.importorskip('numpy')
+    pivot_tokens = ['numbers', 'landlines', 'personal']
+    target_tokens = ['calls', 'personal', 'numbers', 'free']
+    corpus = ['calls', 'to', '0800', 'numbers', 'are', 'numbers', 'free', 'from', 'from', 'personal', 'mobiles',
+              'personal', 'and', 'landlines']
+
+    b = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, corpus, (4, 4), True)
+    score_fn = getattr(BigramAssocMeasures, measure)
+    assert vectorized_measure(score_fn) is not None
+
+    expected = sorted((ngram, b.score_ngram(score_fn, *ngram)) for ngram in b.ngram_fd)
+    assert [ngram for ngram, score in sorted(b.score_ngrams(score_fn))] == [ngram for ngram, score in expected]
+    assert close_enough(sorted(b.score_ngrams(score_fn)), expected)
+
+
+def test_trigram_vectorized_scores():
+    pytest.importorskip('numpy')
+    t = TrigramCollocationFinder.from_words(SENT)
+    for score_fn in [TrigramAssocMeasures.pmi, TrigramAssocMeasures.likelihood_ratio, TrigramAssocMeasures.chi_sq]:
+        expected = sorted((ngram, t.score_ngram(score_fn, *ngram)) for ngram in t.ngram_fd)
+        assert close_enough(sorted(t.score_ngrams(score_fn)), expected)
+
+
+def test_nbest_and_above_score():
+    t = TrigramCollocationFinder.from_words(SENT)
+    for score_fn in [TrigramAssocMeasures.raw_freq, TrigramAssocMeasures.pmi, lambda *marginals: marginals[0]]:
+        ranked = t.score_ngrams(score_fn)
+        for n in [0, 1, 2, 3, len(ranked) + 1]:
+            assert t.nbest(score_fn, n) == [ngram for ngram, score in ranked[:n]]
+        min_score = ranked[len(ranked) // 2][1]
+        assert list(t.above_score(score_fn, min_score)) == [ngram for ngram, score in ranked if score > min_score]
+
+
+def test_encoded_corpus():
+    pivot_tokens = ['numbers', 'landlines']
+    target_tokens = ['calls', 'personal', 'numbers', 'unseen']
+    corpus = ['calls', 'to', '0800', 'numbers', 'are', 'numbers', 'free', 'from', 'from', 'personal', 'mobiles',
+              'personal', 'and', 'landlines']
+    encoded = EncodedCorpus(corpus)
+
+    assert list(encoded) == corpus
+    assert encoded.decode(encoded.ids) == corpus
+    assert encoded[3:6] == corpus[3:6]
+    assert encoded.index('from', 8) == 8
+
+    expected = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, corpus, (4, 4), True)
+    b = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, encoded, (4, 4), True)
+    # the counts stay keyed by token IDs
+    assert all(isinstance(w, int) for w in b.word_fd)
+    assert all(isinstance(w, int) for ngram in b.ngram_fd for w in ngram)
+    assert all(isinstance(w, int) for ngram in b.pos for w in ngram)
+    decoded = b._decoded()
+    assert list(decoded.word_fd.items()) == list(expected.word_fd.items())
+    assert list(decoded.ngram_fd.items()) == list(expected.ngram_fd.items())
+    assert list(decoded.pos.items()) == list(expected.pos.items())
+    assert list(decoded.dist.items()) == list(expected.dist.items())
+    # and are only decoded when reported
+    score_fn = BigramAssocMeasures.raw_freq
+    assert b.score_ngrams(score_fn) == expected.score_ngrams(score_fn)
+    assert b.nbest(score_fn, 2) == expected.nbest(score_fn, 2)
+    assert list(b.above_score(score_fn, 0)) == list(expected.above_score(score_fn, 0))
+    assert b.score_ngrams_multi([score_fn]) == expected.score_ngrams_multi([score_fn])
+
+    b.update(['personal', 'numbers'])
+    expected.update(['personal', 'numbers'])
+    assert b.vocabulary is None
+    assert list(b.ngram_fd.items()) == list(expected.ngram_fd.items())
+    assert list(b.pos.items()) == list(expected.pos.items())
+
+    def score_fn(*marginals):
+        return marginals[0]
+
+    for cls in [TrigramCollocationFinder, QuadgramCollocationFinder]:
+        expected = cls.from_words(corpus)
+        finder = cls.from_words(encoded)
+        assert all(isinstance(w, int) for ngram in finder.ngram_fd for w in ngram)
+        for name, fd in vars(expected).items():
+            if isinstance(fd, dict):
+                assert list(getattr(finder._decoded(), name).items()) == list(fd.items())
+        assert finder.score_ngrams(score_fn) == expected.score_ngrams(score_fn)
+
+        expected = cls.from_words(corpus, stopwords=['to'], min_freq=1)
+        finder = cls.from_words(encoded, stopwords=['to'], min_freq=1)
+        assert finder.nbest(score_fn, 5) == expected.nbest(score_fn, 5)
+
+
+def test_trigram_and_quadgram_counts():
+    t = TrigramCollocationFinder.from_words(['a', 'b', 'a', 'c'], window_size=4)
+    assert dict(t.word_fd) == {'a': 6, 'b': 3, 'c': 3}
+    # bigrams are counted once for every trigram they start, including those cut short by the end
+    assert dict(t.bigram_fd) == {('a', 'b'): 2, ('a', 'a'): 1, ('b', 'a'): 2, ('b', 'c'): 1, ('a', 'c'): 2}
+    assert dict(t.wildcard_fd) == {('a', 'a'): 1, ('a', 'c'): 2, ('b', 'c'): 1}
+    assert dict(t.ngram_fd) == {('a', 'b', 'a'): 1, ('a', 'b', 'c'): 1, ('a', 'a', 'c'): 1, ('b', 'a', 'c'): 1}
+
+    q = QuadgramCollocationFinder.from_words(['a', 'b', 'a', 'c', 'b'], window_size=5)
+    assert dict(q.word_fd) == {'a': 8, 'b': 8, 'c': 4}
+    assert dict(q.ngram_fd) == {('a', 'b', 'a', 'c'): 1, ('a', 'b', 'a', 'b'): 1, ('a', 'b', 'c', 'b'): 1,
+                                ('a', 'a', 'c', 'b'): 1, ('b', 'a', 'c', 'b'): 1}
+    assert dict(q.ii) == {('a', 'b'): 4, ('a', 'a'): 1, ('b', 'a'): 3, ('b', 'c'): 1, ('a', 'c'): 3, ('c', 'b'): 3}
+    assert dict(q.ixxi) == {('a', 'c'): 1, ('a', 'b'): 3, ('b', 'b'): 1}
+
+
+@pytest.mark.parametrize('use_mmap', [True, False])
+def test_save_and_load(tmp_path, use_mmap):
+    pivot_tokens = ['numbers', 'landlines']
+    target_tokens = ['calls', 'personal', 'numbers']
+    corpus = ['calls', 'to', '0800', 'numbers', 'are', 'numbers', 'free', 'from', 'from', 'personal', 'mobiles',
+              'personal', 'and', 'landlines']
+    b = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, corpus, (4, 4), True)
+    b.save(str(tmp_path / 'bigrams.bin'))
+
+    loaded = BigramCollocationFinder.load(str(tmp_path / 'bigrams.bin'), mmap=use_mmap)
+    assert list(loaded.word_fd.items()) == list(b.word_fd.items())
+    assert list(loaded.ngram_fd.items()) == list(b.ngram_fd.items())
+    assert [(k, list(v)) for k, v in loaded.pos.items()] == list(b.pos.items())
+    assert [(k, list(v)) for k, v in loaded.dist.items()] == list(b.dist.items())
+    assert loaded.pos[('personal', 'landlines')][1] == 13
+    assert (loaded.N, loaded.window_size) == (b.N, b.window_size)
+    assert loaded.score_ngrams(BigramAssocMeasures.pmi) == b.score_ngrams(BigramAssocMeasures.pmi)
+
+    t = TrigramCollocationFinder.from_words(SENT)
+    t.save(str(tmp_path / 'trigrams.bin'))
+    loaded = TrigramCollocationFinder.load(str(tmp_path / 'trigrams.bin'), mmap=use_mmap)
+    assert list(loaded.wildcard_fd.items()) == list(t.wildcard_fd.items())
+    with pytest.raises(ValueError):
+        BigramCollocationFinder.load(str(tmp_path / 'trigrams.bin'), mmap=use_mmap)
+
+
+def test_position_store():
+    store = PositionStore()
+    for i in range(10):
+        store.append(('a', 'b'), i)
+        store.append_unique(('b', 'a'), i // 2)
+    store.extend(('a', 'b'), [20, 21])
+    store.append(('c', 'd'), 5)
+
+    assert list(store) == [('a', 'b'), ('b', 'a'), ('c', 'd')]
+    assert store[('a', 'b')] == list(range(10)) + [20, 21]
+    assert store[('b', 'a')] == [0, 1, 2, 3, 4]
+    assert store[('a', 'b')][-1] == 21 and store[('a', 'b')][2:4] == [2, 3]
+
+    store.truncate(('a', 'b'), 3)
+    store.discard(('c', 'd'))
+    store.finalize()
+    assert store == {('a', 'b'): [0, 1, 2], ('b', 'a'): [0, 1, 2, 3, 4]}
+    with pytest.raises(KeyError):
+        store[('c', 'd')]
+
+
+def test_filters_while_counting():
+    words = 'a b c a b d a b c e a c b a'.split()
+    filters = dict(min_freq=2, word_filter=lambda w: w == 'e', stopwords={'d'})
+
+    b = BigramCollocationFinder.from_words(['a'], ['b', 'c', 'd', 'e'], words, (2, 2), **filters)
+    expected = BigramCollocationFinder.from_words(['a'], ['b', 'c', 'd', 'e'], words, (2, 2))
+    expected.apply_filters(**filters)
+    assert list(b.ngram_fd.items()) == list(expected.ngram_fd.items())
+    assert list(b.word_fd.items()) == list(expected.word_fd.items())
+    assert set(b.pos) <= set(b.ngram_fd) and set(b.dist) <= set(b.ngram_fd)
+
+    # filtered finders cannot be updated, however they were filtered
+    for finder in (b, expected):
+        with pytest.raises(ValueError, match='Filtered finders'):
+            finder.update(words)
+    unfiltered = BigramCollocationFinder.from_words(['a'], ['b', 'c', 'd', 'e'], words, (2, 2))
+    with pytest.raises(ValueError, match='Filtered finders'):
+        unfiltered.merge(b)
+
+    for cls in (TrigramCollocationFinder, QuadgramCollocationFinder):
+        finder = cls.from_words(words, **filters)
+        expected = cls.from_words(words)
+        expected.apply_filters(**filters)
+        assert list(finder.ngram_fd.items()) == list(expected.ngram_fd.items())
+
+    calls = []
+    t = TrigramCollocationFinder.from_words(words)
+    t.apply_filters(word_filter=lambda w: calls.append(w) or w == 'c', ngram_filter=lambda *ng: ng[0] == 'b')
+    assert len(calls) == len(set(calls))
+    assert all('c' not in ng and ng[0] != 'b' for ng in t.ngram_fd)
+
+
+def test_score_ngrams_multi():
+    pivot_tokens = ['numbers', 'landlines', 'personal']
+    target_tokens = ['calls', 'personal', 'numbers', 'free']
+    corpus = ['calls', 'to', '0800', 'numbers', 'are', 'numbers', 'free', 'from', 'from', 'personal', 'mobiles',
+              'personal', 'and', 'landlines']
+    b = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, corpus, (4, 4), True)
+    measures = [BigramAssocMeasures.pmi, BigramAssocMeasures.likelihood_ratio, BigramAssocMeasures.chi_sq,
+                BigramAssocMeasures.student_t, BigramAssocMeasures.dice]
+
+    table = b.score_ngrams_multi(measures)
+    assert list(table) == ['ngram', 'pmi', 'likelihood_ratio', 'chi_sq', 'student_t', 'dice']
+    assert table['ngram'] == list(b.ngram_fd)
+    for score_fn in measures:
+        expected = [b.score_ngram(score_fn, *ngram) for ngram in table['ngram']]
+        assert all(abs(score - e) < _EPSILON for score, e in zip(table[score_fn.__name__], expected))
+
+    table = b.score_ngrams_multi({'count': lambda n_ii, n_ix_xi, n_xx: n_ii})
+    assert table['count'] == [b.ngram_fd[ngram] / 4.0 for ngram in table['ngram']]
+
+    t = TrigramCollocationFinder.from_words(SENT)
+    table = t.score_ngrams_multi({'t': TrigramAssocMeasures.student_t, 'raw': TrigramAssocMeasures.raw_freq})
+    assert table['raw'] == [t.score_ngram(TrigramAssocMeasures.raw_freq, *ngram) for ngram in table['ngram']]
+    with pytest.raises(ValueError):
+        b.score_ngrams_multi([BigramAssocMeasures.pmi, TrigramAssocMeasures.pmi])
@@ -1,7 +1,11 @@
+import tempfile
 import unittest
 from io import StringIO
-from nltkma.text import find_concordance
-from nltkma.collocations import BigramCollocationFinder, BigramAssocMeasures
+from unittest import mock
+from nltkma.text import (ConcordanceCache, ConcordancePager, SentenceBoundaryIndex, _collocation_finder,
+                         find_concordance, find_concordances, iter_concordance)
+from nltkma.util import map_cleaned_corpus_array
+from nltkma.collocations import BigramCollocationFinder, BigramAssocMeasures, EncodedCorpus
 
 
 class TestConcordance(unittest.TestCase):
@@ -314,3 +318,192 @@ class TestConcordance(unittest.TestCase):
             assert expected_right_line == result[0].right_span
             assert expected_right_context == result[0].right_context
 
+    def test_find_concordances(self):
+        corpus_token = ['Hi', '!', 'I', 'am', 'black', 'and', 'I', 'am', 'going', 'to', 'get', 'the', 'vaccine',
+                        'next', 'week', '.', 'Black', 'and', 'vaccine', '=', 'love', '.', 'That', 'is', 'all', 'I',
+                        'am', 'going', 'to', 'say', '!']
+        corpus_token_cleaned = ['Hi', 'I', 'am', 'black', 'and', 'I', 'am', 'going', 'to', 'get', 'the', 'vaccine',
+                                'next', 'week', 'Black', 'and', 'vaccine', 'love', 'That', 'is', 'all', 'I', 'am',
+                                'going', 'to', 'say']
+
+        queries = [(['vaccine'], ['black'], (10, 3), (100, 100)),
+                   (['vaccine'], ['Black', 'love'], (2, 2), (1, 1)),
+                   (['am'], ['going'], (1, 1), (2, 2))]
+        result = find_concordances(queries, corpus_token, corpus_token_cleaned, corpus_token_cleaned, True, True,
+                                   False)
+
+        assert len(result) == 3
+        for pivot_token, target_token, span, context in queries:
+            expected = find_concordance(pivot_token, target_token, span, context, corpus_token,
+                                        corpus_token_cleaned, corpus_token_cleaned, True, True, False)
+            actual = result[(tuple(pivot_token), tuple(target_token), span, context)]
+            assert [line.line for line in expected] == [line.line for line in actual]
+            assert [line.dist for line in expected] == [line.dist for line in actual]
+
+    def test_concordance_line_fields(self):
+        corpus_token = ['I', 'am', 'black', 'and', 'I', 'am', 'going', 'to', 'get', 'the', 'vaccine', '.',
+                        'Black', 'and', 'vaccine', '=', 'love', '.']
+        corpus_token_cleaned = ['I', 'am', 'black', 'and', 'I', 'am', 'going', 'to', 'get', 'the', 'vaccine',
+                                'Black', 'and', 'vaccine', 'love']
+
+        result = find_concordance(['vaccine'], ['love', 'black'], (8, 2), (1, 1), corpus_token,
+                                  corpus_token_cleaned, corpus_token_cleaned, True, False, False)
+
+        assert [line.query for line in result] == ['vaccine', 'vaccine']
+        left_context, left_span, query, right_span, right_context, left_print, right_print, line, collocation, \
+            dist = result[1]
+        assert result[1]._asdict()['line'] == line
+        assert line == ' '.join([left_print, query, right_print])
+        assert right_span == '= love .'
+        assert collocation is result[1].collocation
+        assert collocation.ngram_fd[('vaccine', 'love')] == 1
+
+        # lines behave as the tuples of their fields
+        assert len(result[1]) == 10
+        assert result[1][0] == left_context and result[1][-1] == dist
+        assert result[1][3:5] == (right_span, right_context)
+        assert result[1] == tuple(result[1]) and result[1] != result[0]
+        copy = type(result[1])._make(result[1])
+        assert copy == result[1] and hash(copy) == hash(result[1])
+        assert copy.collocation is collocation
+        assert result[1]._replace(dist=5) == tuple(result[1])[:9] + (5,)
+        again = find_concordance(['vaccine'], ['love', 'black'], (8, 2), (1, 1), corpus_token,
+                                 corpus_token_cleaned, corpus_token_cleaned, True, False, False)
+        assert [line[:8] + (line.dist,) for line in again] == [line[:8] + (line.dist,) for line in result]
+
+    def test_concordance_unmapped_tokens(self):
+        # the cleaned tokens were lowercased, but tokens_are_lowercase is false
+        corpus_token = ['x', 'B', 'c', 'd', 'e']
+        corpus_token_cleaned = ['x', 'b', 'c', 'd', 'e']
+
+        with self.assertRaises(ValueError):
+            find_concordance(['x'], ['b'], (2, 2), (1, 1), corpus_token, corpus_token_cleaned, corpus_token_cleaned,
+                             False, True, False)
+        result = find_concordance(['x'], ['b'], (2, 2), (1, 1), corpus_token, corpus_token_cleaned,
+                                  corpus_token_cleaned, False, True, True)
+        assert [line.line for line in result] == ['  x B c d e']
+
+    def test_iter_concordance(self):
+        corpus_token = ['a', 'x', 'b', '.', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+        corpus_token_cleaned = ['a', 'x', 'b', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+
+        args = (['x'], ['a', 'b'], (2, 2), (1, 1), corpus_token, corpus_token_cleaned, corpus_token_cleaned, True,
+                False, False)
+        expected = find_concordance(*args)
+        result = list(iter_concordance(*args))
+
+        assert sorted(line.line for line in expected) == sorted(line.line for line in result)
+        assert [line.left_span for line in result] == ['a'] * 2 + ['b . b'] * 3 + ['x a a'] * 3 + ['a x b'] * 2 + \
+            ['x b x'] * 2
+
+        page = list(iter_concordance(*args, limit=2, offset=3))
+        assert [line.line for line in page] == [line.line for line in result[3:5]]
+        assert list(iter_concordance(*args, offset=len(result))) == []
+
+    def test_concordance_pager(self):
+        corpus_token = ['a', 'x', 'b', '.', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+        corpus_token_cleaned = ['a', 'x', 'b', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+        args = (['x'], ['a', 'b'], (2, 2), (1, 1), corpus_token, corpus_token_cleaned, corpus_token_cleaned, True,
+                False, False)
+        expected = [line.line for line in iter_concordance(*args)]
+
+        with mock.patch('nltkma.text._collocation_finder', wraps=_collocation_finder) as counted, \
+                mock.patch('nltkma.text.map_cleaned_corpus_array', wraps=map_cleaned_corpus_array) as aligned:
+            pager = ConcordancePager(*args)
+            assert len(pager) == len(expected)
+            pages = [[line.line for line in pager.page(offset, 5)] for offset in range(0, len(expected) + 5, 5)]
+            assert pages[-1] == []
+            assert sum(pages, []) == expected
+            assert [line.line for line in pager.page(3)] == expected[3:]
+            # the collocations are counted and the tokens aligned once
+            assert (counted.call_count, aligned.call_count) == (1, 1)
+
+    def test_concordance_encoded_corpus(self):
+        corpus_token = ['a', 'x', 'b', '.', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+        corpus_token_cleaned = ['a', 'x', 'b', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+
+        expected = find_concordance(['x'], ['a', 'b'], (2, 2), (1, 1), corpus_token, corpus_token_cleaned,
+                                    corpus_token_cleaned, True, False, False)
+        result = find_concordance(['x'], ['a', 'b'], (2, 2), (1, 1), corpus_token, EncodedCorpus(corpus_token_cleaned),
+                                  corpus_token_cleaned, True, False, False)
+
+        assert [line.line for line in result] == [line.line for line in expected]
+        assert [line.collocation._decoded().pos for line in result] == \
+               [line.collocation.pos for line in expected]
+
+    def test_concordance_cache(self):
+        corpus_token = ['a', 'x', 'b', '.', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+        corpus_token_cleaned = ['a', 'x', 'b', 'b', 'x', 'a', 'a', 'x', 'b', 'x', 'x', 'b']
+        queries = [(['x'], ['a', 'b'], (2, 2), (1, 1)), (['x'], ['b'], (1, 3), (2, 2)), (['a'], ['x'], (2, 1), (1, 1))]
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ConcordanceCache(maxsize=1, directory=directory)
+            for _ in range(2):
+                for pivot_token, target_token, span, context in queries:
+                    expected = find_concordance(pivot_token, target_token, span, context, corpus_token,
+                                                corpus_token_cleaned, corpus_token_cleaned, False, True, False)
+                    result = cache.find_concordance(pivot_token, target_token[::-1], span, context, corpus_token,
+                                                    list(corpus_token_cleaned), corpus_token_cleaned, False, True,
+                                                    False)
+                    assert [tuple(line)[:8] + (line.dist,) for line in result] == \
+                           [tuple(line)[:8] + (line.dist,) for line in expected]
+
+            stats = cache.stats()
+            assert (stats['hits'], stats['disk_hits'], stats['misses'], stats['size']) == (3, 3, 3, 1)
+
+            finder = cache.collocation_finder(['x'], ['b'], corpus_token_cleaned, (2, 2))
+            assert cache.collocation_finder(['x'], ['b'], list(corpus_token_cleaned), (2, 2)) is finder
+            assert cache.collocation_finder(['x'], ['b'], corpus_token_cleaned[1:], (2, 2)) is not finder
+
+            cache.clear()
+            assert cache.stats()['spilled'] == 0
+
+    def test_concordance_cache_recomputes_on_change(self):
+        corpus_token = ['w%d' % (i % 5000) for i in range(20000)]
+        corpus_token[1000::5000] = ['x'] * 4
+        cache = ConcordanceCache()
+        args = (['x'], ['w1003'], (5, 5), (2, 2), corpus_token, corpus_token, corpus_token, False, True, False)
+
+        with mock.patch('nltkma.text.find_concordance', wraps=find_concordance) as computed:
+            for _ in range(3):
+                assert len(cache.find_concordance(*args)) == 4
+            assert computed.call_count == 1
+
+            # a token that a sample of the document could miss
+            corpus_token[12345] = 'changed'
+            assert len(cache.find_concordance(*args)) == 4
+            assert computed.call_count == 2
+            corpus_token[1000] = 'changed'
+            assert len(cache.find_concordance(*args)) == 3
+            assert computed.call_count == 3
+
+            # a caller-supplied key stands for the contents
+            cache.find_concordance(*args, document_key=('doc', 1))
+            corpus_token[6000] = 'changed'
+            assert len(cache.find_concordance(*args, document_key=('doc', 1))) == 3
+            assert len(cache.find_concordance(*args, document_key=('doc', 2))) == 2
+            assert computed.call_count == 5
+
+        with mock.patch.object(BigramCollocationFinder, 'from_words',
+                               wraps=BigramCollocationFinder.from_words) as computed:
+            finder = cache.collocation_finder(['x'], ['w1003'], corpus_token, (5, 5))
+            assert cache.collocation_finder(['x'], ['w1003'], corpus_token, (5, 5)) is finder
+            corpus_token[12345] = 'changed again'
+            assert cache.collocation_finder(['x'], ['w1003'], corpus_token, (5, 5)) is not finder
+            assert computed.call_count == 2
+
+    def test_concordance_sentence_boundaries(self):
+        corpus_token = ['a', 'x', 'b', '!', 'b', 'x', 'a', '?', 'a', 'x', 'b', '.', 'x', 'x', 'b']
+        corpus_token_dots = ['.' if token in '!?' else token for token in corpus_token]
+        corpus_token_cleaned = [token for token in corpus_token if token not in '.!?']
+
+        expected = find_concordance(['x'], ['a', 'b'], (3, 3), (2, 2), corpus_token_dots, corpus_token_cleaned,
+                                    corpus_token_cleaned, False, True, False)
+        boundaries = SentenceBoundaryIndex(corpus_token, '.!?')
+        result = find_concordance(['x'], ['a', 'b'], (3, 3), (2, 2), corpus_token, corpus_token_cleaned,
+                                  corpus_token_cleaned, False, True, False, sentence_boundaries=boundaries)
+        assert [line.line.replace('!', '.').replace('?', '.') for line in result] == [line.line for line in expected]
+
+        sentences = [['a', 'x', 'b', '!'], ['b', 'x', 'a', '?'], ['a', 'x', 'b', '.'], ['x', 'x', 'b']]
+        assert list(SentenceBoundaryIndex.from_sentences(sentences)) == [3, 7, 11, 14]
+        assert boundaries.first(4, 12) == 7 and boundaries.first(12, 15) is None
@@ -0,0 +1,133 @@
+import asyncio
+import gc
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from nltkma.collocations import BigramCollocationFinder
+from nltkma.concordance_service import ConcordanceService
+from nltkma.text import find_concordance
+
+CORPUS = ['a', 'x', 'b', '.', 'b', 'x', 'a', 'a', 'x', 'b', ',', 'x', 'x', 'b']
+CLEANED = [token for token in CORPUS if token not in '.,']
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_concordance_service():
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            service = ConcordanceService(max_workers=1, executor=executor)
+            service.add_corpus('doc', CORPUS, CLEANED)
+
+            lines = await service.find_concordance('doc', ['x'], ['a', 'b'], (2, 2), (1, 1))
+            expected = find_concordance(['x'], ['a', 'b'], (2, 2), (1, 1), CORPUS, CLEANED, CLEANED, False, True,
+                                        False)
+            assert [line.line for line in lines] == [line.line for line in expected]
+
+            # identical queries in flight are computed once
+            first, second = await asyncio.gather(service.collocations('doc', ['x'], ['b'], (2, 2)),
+                                                 service.collocations('doc', ['x'], ['b'], (2, 2)))
+            assert first is second
+
+            # queued queries start in order of priority
+            done = []
+
+            async def query(span, priority):
+                await service.collocations('doc', ['x'], ['b'], span, priority=priority)
+                done.append(span)
+
+            await asyncio.gather(query((1, 1), 0), query((2, 1), 5), query((1, 2), 1))
+            assert done == [(1, 1), (1, 2), (2, 1)]
+
+            # cancelling the only caller of a queued query drops it
+            running = asyncio.ensure_future(service.collocations('doc', ['x'], ['a'], (3, 3)))
+            queued = asyncio.ensure_future(service.collocations('doc', ['x'], ['a'], (4, 4)))
+            await asyncio.sleep(0)
+            assert service.stats() == {'running': 1, 'pending': 2}
+            queued.cancel()
+            await asyncio.sleep(0)
+            assert service.stats()['pending'] == 1
+            await running
+            assert queued.cancelled()
+
+            # a removed corpus is kept until its submitted queries are done
+            service.add_corpus('other', CORPUS[::-1], CLEANED[::-1])
+            path = service._corpora['other'][0]
+            running = asyncio.ensure_future(service.collocations('doc', ['x'], ['a'], (5, 5)))
+            queued = asyncio.ensure_future(service.find_concordance('other', ['x'], ['a'], (1, 1), (1, 1)))
+            await asyncio.sleep(0)
+            assert service.stats() == {'running': 1, 'pending': 2}
+            service.remove_corpus('other')
+            assert os.path.exists(path)
+            await running
+            lines = await queued
+            expected = find_concordance(['x'], ['a'], (1, 1), (1, 1), CORPUS[::-1], CLEANED[::-1], CLEANED[::-1],
+                                        False, True, False)
+            assert [line.line for line in lines] == [line.line for line in expected]
+            assert not os.path.exists(path)
+
+            service.close()
+
+    _run(main())
+
+
+def test_concordance_service_processes():
+    async def main():
+        with ProcessPoolExecutor(1) as executor:
+            service = ConcordanceService(max_workers=1, executor=executor)
+            service.add_corpus('doc', CORPUS, CLEANED)
+            first_path = service._corpora['doc'][0]
+
+            lines = await service.find_concordance('doc', ['x'], ['a', 'b'], (2, 2), (1, 1))
+            expected = find_concordance(['x'], ['a', 'b'], (2, 2), (1, 1), CORPUS, CLEANED, CLEANED, False, True,
+                                        False)
+            assert [tuple(line)[:8] for line in lines] == [tuple(line)[:8] for line in expected]
+            assert lines[0].collocation.ngram_fd == expected[0].collocation.ngram_fd
+
+            # the worker keeps the corpus it loaded
+            os.remove(first_path)
+            finder = await service.collocations('doc', ['x'], ['b'], (2, 2))
+            assert list(finder.ngram_fd.items()) == list(
+                BigramCollocationFinder.from_words(['x'], ['b'], CLEANED, (2, 2)).ngram_fd.items())
+
+            # replacing a corpus removes the earlier one
+            with open(first_path, 'wb'):
+                pass
+            service.add_corpus('doc', CORPUS[::-1], CLEANED[::-1])
+            assert not os.path.exists(first_path)
+            lines = await service.find_concordance('doc', ['x'], ['a'], (1, 1), (1, 1))
+            expected = find_concordance(['x'], ['a'], (1, 1), (1, 1), CORPUS[::-1], CLEANED[::-1], CLEANED[::-1],
+                                        False, True, False)
+            assert [line.line for line in lines] == [line.line for line in expected]
+
+            directory = service._directory
+            service.close()
+            assert not os.path.exists(directory)
+
+    _run(main())
+
+
+def test_concordance_service_directory():
+    service = ConcordanceService(max_workers=1)
+    assert service._directory is None
+    service.add_corpus('doc', CORPUS, CLEANED)
+    directory = service._directory
+    assert os.listdir(directory)
+    service.remove_corpus('doc')
+    assert not os.listdir(directory)
+    service.close()
+    assert not os.path.exists(directory)
+
+    # the corpora are removed with the service even if it is not closed
+    service = ConcordanceService(max_workers=1)
+    service.add_corpus('doc', CORPUS, CLEANED)
+    directory = service._directory
+    del service
+    gc.collect()
+    assert not os.path.exists(directory)
@@ -1,14 +1,32 @@
 """
 Corpus View Regression Tests
 """
+import os
+import queue
+import sys
+import tempfile
+import threading
+import types
 import unittest
+from unittest import mock
 import nltkma.data
+from nltkma.corpus.reader import PlaintextCorpusReader
 from nltkma.corpus.reader.util import (
+    BlockCache,
+    ConcatenatedCorpusView,
     StreamBackedCorpusView,
+    iterate_in_pool,
     read_whitespace_block,
     read_line_block,
 )
 
+_blocks_read = []
+
+
+def counting_line_block(stream):
+    _blocks_read.append(stream.tell())
+    return read_line_block(stream)
+
 
 class TestCorpusViews(unittest.TestCase):
 
@@ -45,3 +63,133 @@ class TestCorpusViews(unittest.TestCase):
 
             v = StreamBackedCorpusView(f, read_line_block)
             self.assertEqual(len(v), len(self.linetok.tokenize(file_data)))
+
+    def test_block_index(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'lines.txt')
+            with open(path, 'w', encoding='utf8') as fp:
+                fp.write(''.join('line %d \u00e9\n' % i for i in range(200)))
+            index_directory = os.path.join(root, 'index')
+
+            v = StreamBackedCorpusView(path, counting_line_block, index_directory=index_directory)
+            self.assertEqual(v[150], 'line 150 \u00e9')
+            self.assertEqual(len(v), 200)
+            self.assertEqual(len(os.listdir(index_directory)), 1)
+
+            # a new view starts from the saved mapping
+            del _blocks_read[:]
+            v = StreamBackedCorpusView(path, counting_line_block, index_directory=index_directory)
+            self.assertEqual(len(v), 200)
+            self.assertEqual(v[-1], 'line 199 \u00e9')
+            self.assertEqual(len(_blocks_read), 1)
+            self.assertEqual(list(v), ['line %d \u00e9' % i for i in range(200)])
+
+            # views read differently, and closures, are not matched
+            v = StreamBackedCorpusView(path, read_whitespace_block, index_directory=index_directory)
+            self.assertEqual(len(v), 600)
+            v = StreamBackedCorpusView(path, lambda stream: read_line_block(stream), index_directory=index_directory)
+            self.assertEqual(len(v), 200)
+            self.assertEqual(len(os.listdir(index_directory)), 2)
+
+            StreamBackedCorpusView.index_directory = os.path.join(root, 'reader')
+            try:
+                reader = PlaintextCorpusReader(root, r'.*\.txt')
+                reader.build_block_indexes(background=True).join()
+                self.assertEqual(len(os.listdir(os.path.join(root, 'reader'))), 1)
+                self.assertEqual(len(reader.words('lines.txt')), 600)
+            finally:
+                StreamBackedCorpusView.index_directory = None
+
+    def test_block_cache(self):
+        with tempfile.TemporaryDirectory() as root:
+            paths = []
+            for name in 'ab':
+                paths.append(os.path.join(root, name + '.txt'))
+                with open(paths[-1], 'w', encoding='utf8') as fp:
+                    fp.write(''.join('%s %d\n' % (name, i) for i in range(100)))
+
+            cache = BlockCache(max_tokens=40)
+            v = ConcatenatedCorpusView([StreamBackedCorpusView(path, counting_line_block) for path in paths], cache)
+            self.assertTrue(all(piece.block_cache is cache for piece in v._pieces))
+            self.assertEqual(list(v), ['%s %d' % (name, i) for name in 'ab' for i in range(100)])
+
+            # alternating between distant tokens reads each block once, after
+            # the five blocks read to find token 90
+            del _blocks_read[:]
+            v = StreamBackedCorpusView(paths[0], counting_line_block, block_cache=cache)
+            for _ in range(5):
+                self.assertEqual((v[90], v[10]), ('a 90', 'a 10'))
+            self.assertEqual(len(_blocks_read), 6)
+            self.assertEqual(cache.stats()['hits'], 8)
+            self.assertEqual(cache.stats()['tokens'], 40)
+
+            del _blocks_read[:]
+            cache = BlockCache(max_tokens=None, max_bytes=300)
+            v = StreamBackedCorpusView(paths[0], counting_line_block, block_cache=cache, readahead=3)
+            self.assertEqual(v[20], 'a 20')
+            self.assertEqual(len(_blocks_read), 4)
+            self.assertEqual(v[60], 'a 60')
+            self.assertEqual(len(_blocks_read), 4)
+            self.assertEqual(cache.stats()['blocks'], 3)
+
+    def test_iter_parallel(self):
+        with tempfile.TemporaryDirectory() as root:
+            for i in range(6):
+                with open(os.path.join(root, '%d.txt' % i), 'w', encoding='utf8') as fp:
+                    fp.write(' '.join('w%d.%d,' % (i, j) for j in range(500)))
+            reader = PlaintextCorpusReader(root, r'.*\.txt')
+
+            expected = list(reader.words())
+            self.assertEqual(list(reader.iter_parallel('words', workers=3, max_pending=2)), expected)
+            self.assertEqual(list(reader.iter_parallel('words', fileids=['4.txt', '1.txt'], workers=2,
+                                                       processes=True)),
+                             list(reader.words(['4.txt', '1.txt'])))
+
+            words = reader.iter_parallel('words', workers=2, max_pending=1)
+            self.assertEqual(next(words), 'w0')
+            words.close()
+
+    def test_iterate_in_pool_bounded(self):
+        produced = {}
+        channels = []
+
+        class RecordingQueue(queue.Queue):
+            # sets ``blocked`` once a worker finds its channel full
+            def __init__(self, maxsize):
+                super().__init__(maxsize)
+                self.blocked = threading.Event()
+                channels.append(self)
+
+            def put(self, item, block=True, timeout=None):
+                if self.full():
+                    self.blocked.set()
+                super().put(item, block, timeout)
+
+        def items(task, n):
+            for i in range(n):
+                produced[task] = i + 1
+                yield i
+
+        module = sys.modules[iterate_in_pool.__module__]
+        with mock.patch.object(module, 'queue', types.SimpleNamespace(Queue=RecordingQueue, Full=queue.Full)):
+            items_iter = iterate_in_pool(items, [(0, 100000), (1, 100000)], workers=2, max_pending=2,
+                                         chunk_size=10)
+            self.assertEqual([next(items_iter) for _ in range(5)], [0, 1, 2, 3, 4])
+            # wait until both workers are held back by their full channels,
+            # which they retry sending to, after the first chunk was taken
+            self.assertEqual(len(channels), 2)
+            for channel in channels:
+                channel.blocked.clear()
+            for channel in channels:
+                self.assertTrue(channel.blocked.wait(60))
+            # each worker holds one chunk and two more are queued; the
+            # first chunk of the first task is being generated
+            self.assertEqual(produced, {0: 4 * 10, 1: 3 * 10})
+            items_iter.close()
+
+        def failing(n):
+            yield from range(n)
+            raise ValueError('unreadable')
+
+        with self.assertRaises(ValueError):
+            list(iterate_in_pool(failing, [(25,)], workers=1, chunk_size=10))
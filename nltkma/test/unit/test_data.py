@@ -11,3 +11,62 @@ def test_find_raises_exception_with_full_resource_name():
     with pytest.raises(LookupError) as exc:
         nltkma.data.find(no_such_thing)
         assert no_such_thing in str(exc)
+
+
+def test_resource_cache(tmp_path, monkeypatch):
+    for name in 'abc':
+        (tmp_path / (name + '.txt')).write_text(name * 1000)
+    urls = ['file:' + str(tmp_path / (name + '.txt')) for name in 'abc']
+
+    cache = nltkma.data.ResourceCache(max_entries=2, ttl={'text': 60})
+    old_cache = nltkma.data.set_resource_cache(cache)
+    try:
+        resources = nltkma.data.warm_cache(urls, workers=2)
+        assert [resources[url] for url in urls] == ['a' * 1000, 'b' * 1000, 'c' * 1000]
+        # the least recently used resource was evicted
+        assert cache.stats()['evictions'] == 1 and len(cache) == 2
+        assert nltkma.data.load(urls[2]) is resources[urls[2]]
+        assert cache.stats()['hits'] == 1
+
+        # text resources expire after a minute
+        now = nltkma.data.time.monotonic()
+        monkeypatch.setattr(nltkma.data.time, 'monotonic', lambda: now + 61)
+        assert nltkma.data.load(urls[2]) == 'c' * 1000
+        assert cache.stats()['expirations'] == 1
+    finally:
+        nltkma.data.set_resource_cache(old_cache)
+
+
+def test_resource_cache_limits():
+    class Model:
+        def __init__(self, size):
+            self.weights = [0.5] * size
+
+    cache = nltkma.data.ResourceCache(max_bytes=100000, weak_threshold=50000)
+    small = [Model(1000) for _ in range(20)]
+    for i, model in enumerate(small):
+        cache[('small%d' % i, 'pickle')] = model
+    stats = cache.stats()
+    assert 0 < stats['bytes'] <= 100000 and stats['evictions'] > 0
+    assert cache.get(('small19', 'pickle')) is small[19]
+    assert cache.get(('small0', 'pickle')) is None
+
+    # large resources stay cached only while they are used elsewhere
+    large = Model(10000)
+    cache[('large', 'pickle')] = large
+    assert cache.stats()['bytes'] == stats['bytes']
+    assert cache.get(('large', 'pickle')) is large
+    del large
+    assert cache.get(('large', 'pickle')) is None
+
+
+def test_resource_cache_default_does_not_estimate(monkeypatch):
+    def estimate(value):
+        raise AssertionError('size estimated without a size limit')
+
+    monkeypatch.setattr(nltkma.data, '_estimate_size', estimate)
+    cache = nltkma.data.ResourceCache(max_entries=10, ttl=60)
+    resource = [[0.5] * 10 for _ in range(10)]
+    cache[('model', 'pickle')] = resource
+    assert cache.get(('model', 'pickle')) is resource
+    assert cache.stats()['bytes'] == 0
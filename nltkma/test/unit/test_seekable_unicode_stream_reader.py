@@ -3,6 +3,7 @@ import os
 import pytest
 
 from nltkma.corpus.reader import SeekableUnicodeStreamReader
+from nltkma.data import MappedUnicodeStreamReader, seekable_unicode_stream
 
 
 def check_reader(unicode_string, encoding):
@@ -77,6 +78,42 @@ def test_reader_stream_closes_when_deleted():
     assert reader.stream.closed
 
 
+@pytest.mark.parametrize("string", STRINGS)
+def test_mapped_reader(string, tmp_path):
+    path = tmp_path / "test.txt"
+    path.write_bytes(b"\xef\xbb\xbf" + string.encode("utf-8"))
+
+    with SeekableUnicodeStreamReader(open(str(path), "rb"), "utf-8") as reader:
+        expected = [reader.readline() for _ in range(3)]
+    with seekable_unicode_stream(open(str(path), "rb"), "utf-8") as reader:
+        assert isinstance(reader, MappedUnicodeStreamReader)
+        assert reader.tell() == 0
+        assert "".join(reader.readlines()) == string
+        assert reader.tell() == path.stat().st_size
+
+        reader.seek(0)
+        assert [reader.readline() for _ in range(3)] == expected
+
+        # character offsets do not count the byte order marker
+        reader.CHECKPOINT_INTERVAL = 5
+        for offset in range(0, len(string), 7):
+            reader.char_seek(offset)
+            assert reader.tell() == 3 + len(string[:offset].encode("utf-8"))
+            assert reader.char_tell() == offset
+            assert reader.read(1) == string[offset]
+
+
+def test_mapped_reader_fallback(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    with seekable_unicode_stream(open(str(path), "rb"), "utf-8") as reader:
+        assert type(reader) is SeekableUnicodeStreamReader
+        assert reader.read() == ""
+    reader = seekable_unicode_stream(BytesIO(b"abc"), "utf-8")
+    assert type(reader) is SeekableUnicodeStreamReader
+    reader.close()
+
+
 def teardown_module(module=None):
     import gc
     gc.collect()
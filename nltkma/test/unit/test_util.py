@@ -4,7 +4,9 @@ Unit tests for nltk.util.
 
 import unittest
 from nltkma.util import everygrams
-from nltkma.util import map_cleaned_corpus
+from nltkma.util import map_cleaned_corpus, map_cleaned_corpus_array, cached_map_cleaned_corpus
+from nltkma.util import Instrumentation, current_instrumentation
+from nltkma.text import find_concordance
 
 
 class TestEverygrams(unittest.TestCase):
@@ -102,4 +104,53 @@ def test_map_cleaned_corpus_2():
 
     result = map_cleaned_corpus(corpus, corpus_cleaned,True)
 
-    assert result == [0, 1, 2, 3, 4, 5, 6]
\ No newline at end of file
+    assert result == [0, 1, 2, 3, 4, 5, 6]
+
+
+def test_map_cleaned_corpus_unaligned():
+    corpus = ['I', ',', 'like', 'you']
+    corpus_cleaned = ['I', 'love', 'you']
+
+    assert map_cleaned_corpus(corpus, corpus_cleaned, False) == [0, None, 3]
+    assert list(map_cleaned_corpus_array(corpus, corpus_cleaned, False)) == [0, -1, 3]
+
+
+def test_cached_map_cleaned_corpus():
+    corpus = ['I', '@', '!', 'really', ',', 'like', 'you', ',', 'a', ',', 'lot', 'yes']
+    corpus_cleaned = ['I', 'really', 'like', 'you', 'a', 'lot', 'yes']
+
+    result = cached_map_cleaned_corpus(corpus, corpus_cleaned, False)
+
+    assert list(result) == [0, 3, 5, 6, 8, 10, 11]
+    assert cached_map_cleaned_corpus(corpus, corpus_cleaned, False) is result
+    assert cached_map_cleaned_corpus(corpus, list(corpus_cleaned), False) is not result
+
+    # a list modified in place is aligned again under a new version
+    corpus_cleaned[-1] = 'no'
+    assert cached_map_cleaned_corpus(corpus, corpus_cleaned, False) is result
+    result = cached_map_cleaned_corpus(corpus, corpus_cleaned, False, version=1)
+    assert list(result) == [0, 3, 5, 6, 8, 10, -1]
+    assert cached_map_cleaned_corpus(corpus, corpus_cleaned, False, version=1) is result
+
+
+def test_instrumentation():
+    corpus = ['a', 'b', '.', 'c', 'a', 'b', 'c', ',', 'a', 'c']
+    corpus_cleaned = [token for token in corpus if token not in '.,']
+    reports = []
+
+    assert current_instrumentation() is None
+    with Instrumentation(callback=reports.append) as stats:
+        with Instrumentation() as inner:
+            assert current_instrumentation() is inner
+        assert current_instrumentation() is stats
+        lines = find_concordance(['a'], ['c'], (2, 2), (2, 2), corpus, corpus_cleaned, corpus_cleaned, False,
+                                 True, False)
+        text = [line.line for line in lines]
+    assert current_instrumentation() is None
+    assert reports == [stats] and not inner.timings
+
+    assert stats.counters['hits'] == len(lines)
+    assert stats.counters['windows'] == 6
+    assert 0 < stats.counters['characters_joined'] < sum(len(line) for line in text)
+    assert set(stats.timings) == {'scanning', 'counting', 'collocations', 'map_cleaned_corpus', 'slicing',
+                                  'punctuation', 'rendering'}
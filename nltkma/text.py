@@ -13,16 +13,285 @@ Functionality includes: concordancing, collocation discovery,
 regular expression search over tokenized strings, and
 distributional similarity.
 """
-from collections import namedtuple
-from nltkma.util import map_cleaned_corpus
-from nltkma.collocations import BigramCollocationFinder
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from time import perf_counter
+
+from nltkma.util import current_instrumentation, instrumented_stage, map_cleaned_corpus_array
+from nltkma.collocations import BigramCollocationFinder, CollocationIndex, EncodedCorpus
 from nltkma.probability import FreqDist
 
-ConcordanceLine = namedtuple(
-    "ConcordanceLine",
-    ["left_context", "left_span", "query", "right_span", "right_context", "left_print", "right_print", "line",
-     "collocation", "dist"],
-)
+class ConcordanceLine:
+    """
+    A single line of a concordance, centred on an occurrence of a pivot
+    token.
+
+    A line only stores the integer offsets of its spans and contexts into
+    the original tokens; the text of each field is built the first time it
+    is read, and then cached.  ``collocation`` is a ``BigramCollocationFinder``
+    restricted to the counts of this line's collocation, built on first
+    access and shared by all lines of the same query with that collocation.
+
+    For compatibility with the former named tuple, a line behaves as the
+    tuple of its fields in ``_fields`` order: it can be iterated over,
+    indexed, compared and hashed.  ``_make`` and ``_replace`` return lines
+    whose fields are all given, rather than built from the tokens.
+    """
+
+    _fields = ("left_context", "left_span", "query", "right_span", "right_context", "left_print", "right_print",
+               "line", "collocation", "dist")
+
+    __slots__ = ("_tokens", "_offsets", "_context_left_exists", "_context_right_exists", "query", "dist",
+                 "_collocation_key", "_collocations", "_left_context", "_left_span", "_right_span",
+                 "_right_context", "_left_print", "_right_print", "_line")
+
+    def __init__(self, tokens, offsets, context_left_exists, context_right_exists, query, dist, collocation_key,
+                 collocations):
+        self._tokens = tokens
+        # (left_context, left_span, right_span, right_context) as
+        # (start, stop) offset pairs into tokens
+        self._offsets = offsets
+        self._context_left_exists = context_left_exists
+        self._context_right_exists = context_right_exists
+        self.query = query
+        self.dist = dist
+        self._collocation_key = collocation_key
+        self._collocations = collocations
+        self._left_context = None
+        self._left_span = None
+        self._right_span = None
+        self._right_context = None
+        self._left_print = None
+        self._right_print = None
+        self._line = None
+
+    def _join(self, start, stop):
+        stats = current_instrumentation()
+        if stats is None:
+            return " ".join(self._tokens[start:stop])
+        start_time = perf_counter()
+        text = " ".join(self._tokens[start:stop])
+        stats.add_time("rendering", perf_counter() - start_time)
+        stats.count("characters_joined", len(text))
+        return text
+
+    @property
+    def left_context(self):
+        if self._left_context is None:
+            if self._context_left_exists:
+                self._left_context = self._join(*self._offsets[0:2])
+            else:
+                self._left_context = " "
+        return self._left_context
+
+    @property
+    def left_span(self):
+        if self._left_span is None:
+            self._left_span = self._join(*self._offsets[2:4])
+        return self._left_span
+
+    @property
+    def right_span(self):
+        if self._right_span is None:
+            self._right_span = self._join(*self._offsets[4:6])
+        return self._right_span
+
+    @property
+    def right_context(self):
+        if self._right_context is None:
+            if self._context_right_exists:
+                self._right_context = self._join(*self._offsets[6:8])
+            else:
+                self._right_context = " "
+        return self._right_context
+
+    @property
+    def left_print(self):
+        if self._left_print is None:
+            self._left_print = " ".join([self.left_context, self.left_span])
+        return self._left_print
+
+    @property
+    def right_print(self):
+        if self._right_print is None:
+            self._right_print = " ".join([self.right_span, self.right_context])
+        return self._right_print
+
+    @property
+    def line(self):
+        """The WYSIWYG line of the concordance."""
+        if self._line is None:
+            self._line = " ".join([self.left_print, self.query, self.right_print])
+        return self._line
+
+    @property
+    def collocation(self):
+        return self._collocations[self._collocation_key]
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(getattr(self, field) for field in self._fields[index])
+        return getattr(self, self._fields[index])
+
+    def __eq__(self, other):
+        if isinstance(other, (ConcordanceLine, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, (ConcordanceLine, tuple)):
+            return tuple(self) < tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    @classmethod
+    def _make(cls, iterable):
+        """Make a line of the given field values, in ``_fields`` order."""
+        fields = tuple(iterable)
+        if len(fields) != len(cls._fields):
+            raise TypeError("Expected %d arguments, got %d" % (len(cls._fields), len(fields)))
+        left_context, left_span, query, right_span, right_context, left_print, right_print, line, collocation, \
+            dist = fields
+        concordance_line = cls(None, None, True, True, query, dist, None, {None: collocation})
+        concordance_line._left_context = left_context
+        concordance_line._left_span = left_span
+        concordance_line._right_span = right_span
+        concordance_line._right_context = right_context
+        concordance_line._left_print = left_print
+        concordance_line._right_print = right_print
+        concordance_line._line = line
+        return concordance_line
+
+    def _replace(self, **kwargs):
+        """Return a copy of this line with the given fields replaced."""
+        fields = self._asdict()
+        unknown = set(kwargs) - set(fields)
+        if unknown:
+            raise ValueError("Got unexpected field names: %r" % sorted(unknown))
+        fields.update(kwargs)
+        return self._make(fields[field] for field in self._fields)
+
+    def __repr__(self):
+        return "<ConcordanceLine: %r>" % self.line
+
+
+class _CollocationViews(dict):
+    """
+    Per-collocation ``BigramCollocationFinder`` objects holding only the
+    counts of one collocation, built on demand from a parent finder.
+    """
+
+    def __init__(self, finder):
+        super().__init__()
+        self._finder = finder
+
+    def __missing__(self, collocation):
+        b = self._finder
+        coll_fd = FreqDist()
+        coll_fd[collocation] = b.ngram_fd[collocation]
+
+        word_fd = FreqDist()
+        word_fd[collocation[0]] = b.word_fd[collocation[0]]
+        word_fd[collocation[1]] = b.word_fd[collocation[1]]
+
+        view = self[collocation] = BigramCollocationFinder(word_fd, coll_fd, b.pos, b.dist, b.window_size)
+        view.vocabulary = b.vocabulary
+        return view
+
+
+class SentenceBoundaryIndex:
+    """
+    The sorted offsets of the sentence boundaries of a list of tokens, which
+    lets ``find_concordance`` find the first boundary within a span or a
+    context with a binary search.
+
+    By default the boundaries are the tokens in ``terminators``; the index
+    may instead be built from the offsets of the last token of each sentence
+    found by a sentence tokenizer such as Punkt, with ``from_sentences``::
+
+        >>> tokens = ['Hi', '!', 'It', 'is', 'me', '.', 'Yes']
+        >>> list(SentenceBoundaryIndex(tokens, '.!?;'))
+        [1, 5]
+        >>> list(SentenceBoundaryIndex.from_sentences([['Hi', '!'], ['It', 'is', 'me', '.'], ['Yes']]))
+        [1, 5, 6]
+        >>> SentenceBoundaryIndex(tokens, '.!?;').first(2, 7)
+        5
+    """
+
+    def __init__(self, tokens, terminators=(".",)):
+        terminators = frozenset(terminators)
+        self.offsets = array("l", [i for i, token in enumerate(tokens) if token in terminators])
+
+    @classmethod
+    def from_offsets(cls, offsets):
+        """Build an index of the given boundary offsets."""
+        index = cls(())
+        index.offsets = array("l", sorted(offsets))
+        return index
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        """
+        Build an index of the ends of ``sentences``, lists of tokens which
+        concatenated are the tokens the index is queried for.
+        """
+        offsets = []
+        n_tokens = 0
+        for sentence in sentences:
+            if sentence:
+                n_tokens += len(sentence)
+                offsets.append(n_tokens - 1)
+        return cls.from_offsets(offsets)
+
+    def first(self, start, stop):
+        """
+        Return the offset of the first boundary in ``[start:stop]``, or None.
+        """
+        i = bisect_left(self.offsets, start)
+        if i < len(self.offsets) and self.offsets[i] < stop:
+            return self.offsets[i]
+        return None
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return "<SentenceBoundaryIndex with %d boundaries>" % len(self.offsets)
+
+
+class _TokenBoundaries:
+    """
+    The sentence boundaries at each occurrence of one terminator token,
+    found by scanning the tokens.
+    """
+
+    def __init__(self, tokens, terminator="."):
+        self._tokens = tokens
+        self._terminator = terminator
+
+    def first(self, start, stop):
+        return _find_token(self._tokens, self._terminator, start, stop)
+
 
 def join_punctuation(seq, characters='.,;?!'):
     characters = set(characters)
@@ -39,152 +308,577 @@ def join_punctuation(seq, characters='.,;?!'):
     yield current
 
 def find_concordance(pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens, tokens_no_stamming, allow_self_reference,
-                     ignore_punctuation, tokens_are_lowercase):
+                     ignore_punctuation, tokens_are_lowercase, index_mapping=None, sentence_boundaries=None):
     """
     Find all concordance lines given the query word.
 
     Provided with a list of words, these will be found as a phrase.
+    ``cleaned_tokens`` may also be a ``CollocationIndex`` built over the
+    cleaned tokens, in which case repeated queries against the same document
+    only visit the occurrences of the pivot and target tokens, or an
+    ``EncodedCorpus``, in which case the collocations are counted on token
+    IDs.
+
+    ``index_mapping`` maps each cleaned token to its index in
+    ``original_tokens``, as returned by ``map_cleaned_corpus_array``.  If it
+    is not given, it is computed for this call; pass the mapping returned by
+    ``nltkma.util.cached_map_cleaned_corpus`` to reuse it across calls.  A
+    ``ValueError`` is raised if a line needs a cleaned token that could not
+    be mapped to the original tokens.
+
+    With ``ignore_punctuation``, spans and contexts are cut at the first
+    sentence boundary they contain: by default, a ``'.'`` token.  Pass a
+    ``SentenceBoundaryIndex`` over ``original_tokens`` as
+    ``sentence_boundaries`` to recognise other boundaries, and to find them
+    with a binary search rather than by scanning each span and context.
+
+    While an ``nltkma.util.Instrumentation`` is active, the time spent in
+    each stage (``collocations``, ``map_cleaned_corpus``, ``slicing`` and
+    ``punctuation``) and the number of ``hits`` are recorded in it.  The text
+    of the lines is joined when it is first read, which is recorded in the
+    ``rendering`` stage and the ``characters_joined`` counter of the
+    instrumentation active at that time.
     """
+    stats = current_instrumentation()
+    with instrumented_stage(stats, "collocations"):
+        b = _collocation_finder(pivot_tokens, target_tokens, cleaned_tokens, span, allow_self_reference)
 
-    b = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, cleaned_tokens, span, allow_self_reference, )
+    if index_mapping is None:
+        with instrumented_stage(stats, "map_cleaned_corpus"):
+            index_mapping = map_cleaned_corpus_array(original_tokens, tokens_no_stamming, tokens_are_lowercase)
+    return list(_iter_concordance_lines(b, _collocation_order(b), span, context, original_tokens, cleaned_tokens,
+                                        index_mapping, ignore_punctuation, sentence_boundaries))
 
-    index_mapping = map_cleaned_corpus(original_tokens, tokens_no_stamming,tokens_are_lowercase)
-    # Find the instances of the word to create the ConcordanceLine
-    concordance_list = []
 
-    for collocation in b.pos:
-        for i in range(len(b.pos[collocation])):
-            pos = b.pos[collocation][i]
-            query_word = cleaned_tokens[pos]
-            target_token = ''
+def iter_concordance(pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens, tokens_no_stamming,
+                     allow_self_reference, ignore_punctuation, tokens_are_lowercase, index_mapping=None, limit=None,
+                     offset=0, sentence_boundaries=None):
+    """
+    Generate the concordance lines of ``find_concordance`` one at a time,
+    in the order in which their query words occur in the corpus.
+
+    Only the collocation counts are computed up front; each line is built
+    when it is reached, so a consumer that stops early does not pay for the
+    remaining matches.  ``offset`` lines are skipped without being built and
+    at most ``limit`` lines are generated.  Each call counts the
+    collocations again; to page through the results, use a
+    ``ConcordancePager``, which counts them once for all pages.
+
+    :param limit: the maximum number of lines to generate, or None for all
+    :type limit: int
+    :param offset: the number of lines to skip
+    :type offset: int
+    :rtype: iter(ConcordanceLine)
+    """
+    pager = ConcordancePager(pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens,
+                             tokens_no_stamming, allow_self_reference, ignore_punctuation, tokens_are_lowercase,
+                             index_mapping, sentence_boundaries)
+    yield from pager.page(offset, limit)
 
-            if collocation[0] == query_word:
-                target_token = collocation[1]
-            else:
-                target_token = collocation[0]
 
-            # Find the context of query word.
-            # i- context = contex left span
-            context_left_exists = True
-            context_right_exists = True
+class ConcordancePager:
+    """
+    The concordance lines of one query, in the order of ``iter_concordance``,
+    built a page at a time::
+
+        pager = ConcordancePager(pivot_tokens, target_tokens, span, context, original_tokens,
+                                 cleaned_tokens, tokens_no_stamming, False, True, False)
+        first_page = list(pager.page(0, 20))
+        second_page = list(pager.page(20, 20))
+
+    The collocations are counted when the pager is created, and the cleaned
+    tokens are aligned with the original ones when the first line is built;
+    every page then reuses both, and only builds its own lines.  The
+    arguments are as for ``find_concordance``, and the token lists must not
+    be modified while the pager is in use.
+    """
+
+    def __init__(self, pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens,
+                 tokens_no_stamming, allow_self_reference, ignore_punctuation, tokens_are_lowercase,
+                 index_mapping=None, sentence_boundaries=None):
+        with instrumented_stage(current_instrumentation(), "collocations"):
+            self._finder = _collocation_finder(pivot_tokens, target_tokens, cleaned_tokens, span,
+                                               allow_self_reference)
+        self._hits = _corpus_order(self._finder)
+        self._span = span
+        self._context = context
+        self._original_tokens = original_tokens
+        self._cleaned_tokens = cleaned_tokens
+        self._tokens_no_stamming = tokens_no_stamming
+        self._ignore_punctuation = ignore_punctuation
+        self._tokens_are_lowercase = tokens_are_lowercase
+        self._index_mapping = index_mapping
+        if sentence_boundaries is None:
+            sentence_boundaries = _TokenBoundaries(original_tokens)
+        self._sentence_boundaries = sentence_boundaries
+
+    def __len__(self):
+        """The number of lines of all pages."""
+        return len(self._hits)
+
+    def page(self, offset=0, limit=None):
+        """
+        Generate the lines of the page of at most ``limit`` lines (or all
+        the remaining lines, if None) after the first ``offset`` ones.
+
+        :rtype: iter(ConcordanceLine)
+        """
+        stop = None if limit is None else offset + limit
+        hits = self._hits[offset:stop]
+        if not hits:
+            return iter(())
+        if self._index_mapping is None:
+            with instrumented_stage(current_instrumentation(), "map_cleaned_corpus"):
+                self._index_mapping = map_cleaned_corpus_array(self._original_tokens, self._tokens_no_stamming,
+                                                               self._tokens_are_lowercase)
+        return _iter_concordance_lines(self._finder, hits, self._span, self._context, self._original_tokens,
+                                       self._cleaned_tokens, self._index_mapping, self._ignore_punctuation,
+                                       self._sentence_boundaries)
+
+
+def find_concordances(queries, original_tokens, cleaned_tokens, tokens_no_stamming, allow_self_reference,
+                      ignore_punctuation, tokens_are_lowercase, index_mapping=None, sentence_boundaries=None):
+    """
+    Find the concordance lines of many queries against the same document.
+
+    Each query is a ``(pivot_tokens, target_tokens, span, context)`` tuple;
+    the remaining arguments are as for ``find_concordance``.  The document
+    is indexed and aligned with ``original_tokens`` only once, and each query
+    then only visits the occurrences of its own pivot and target tokens.
+    Queries that differ only in their context share one collocation finder.
 
-            left_span = original_tokens[max(0, max(0,index_mapping[pos]- span[0]-1)): index_mapping[pos]]
+    Returns a dictionary mapping each query, with its token lists and
+    ranges converted to tuples, to the list of ``ConcordanceLine`` that
+    ``find_concordance`` would return for it.
+    """
+    if isinstance(cleaned_tokens, CollocationIndex):
+        index = cleaned_tokens
+    else:
+        index = CollocationIndex(cleaned_tokens)
+    if index_mapping is None:
+        index_mapping = map_cleaned_corpus_array(original_tokens, tokens_no_stamming, tokens_are_lowercase)
+
+    finders = {}
+    results = {}
+    for pivot_tokens, target_tokens, span, context in queries:
+        query = (tuple(pivot_tokens), tuple(target_tokens), tuple(span), tuple(context))
+        if query in results:
+            continue
+        finder_key = query[:3]
+        b = finders.get(finder_key)
+        if b is None:
+            b = finders[finder_key] = BigramCollocationFinder.from_index(pivot_tokens, target_tokens, index, span,
+                                                                         allow_self_reference)
+        results[query] = list(_iter_concordance_lines(b, _collocation_order(b), span, context, original_tokens,
+                                                      index, index_mapping, ignore_punctuation,
+                                                      sentence_boundaries))
+    return results
+
+
+class ConcordanceCache:
+    """
+    An opt-in cache of the results of ``find_concordance`` and of the
+    pivot/target ``BigramCollocationFinder.from_words``, for applications
+    that repeat the same queries against unchanged documents::
+
+        cache = ConcordanceCache(maxsize=256)
+        lines = cache.find_concordance(pivot_tokens, target_tokens, span, context, original_tokens,
+                                       cleaned_tokens, tokens_no_stamming, False, True, False)
+
+    Results are keyed by the query and by a hash of the contents of each
+    token list, so that a document modified in place is never served stale
+    results; the order and duplicates of the pivot and target tokens do not
+    matter.  Hashing costs a pass over the tokens on every lookup, which
+    callers may avoid by passing a ``document_key``: any hashable value that
+    identifies the contents of the token lists, such as a document ID and a
+    version number that is incremented whenever the document changes.
+
+    At most ``maxsize`` results are kept in memory, evicting the least
+    recently used.  If ``directory`` is given, evicted results are pickled
+    to it and read back when they are requested again, also by other
+    processes sharing the directory, which should therefore be trusted.
+
+    The cache may be shared across threads.  Cached results are shared by
+    all callers, and must not be modified; in particular, do not filter or
+    update a cached finder.
+    """
 
+    def __init__(self, maxsize=128, directory=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.directory = directory
+        self._entries = {}
+        self._spilled = set()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+
+    def find_concordance(self, pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens,
+                         tokens_no_stamming, allow_self_reference, ignore_punctuation, tokens_are_lowercase,
+                         index_mapping=None, document_key=None):
+        """
+        Return ``find_concordance`` of the same arguments, from the cache if
+        possible.  Calls passing an ``index_mapping`` are not cached.
+
+        :param document_key: if given, identifies the contents of the token
+            lists in place of hashing them
+        """
+        if index_mapping is not None:
+            return find_concordance(pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens,
+                                    tokens_no_stamming, allow_self_reference, ignore_punctuation,
+                                    tokens_are_lowercase, index_mapping)
+        if document_key is None:
+            document_key = (_fingerprint(original_tokens), _fingerprint(cleaned_tokens),
+                            _fingerprint(tokens_no_stamming))
+        key = ("concordance", document_key, _token_set(pivot_tokens), _token_set(target_tokens), tuple(span),
+               tuple(context), bool(allow_self_reference), bool(ignore_punctuation), bool(tokens_are_lowercase))
+        entry = self._get(key)
+        if entry is not None:
+            if isinstance(entry, DetachedConcordanceLines):
+                entry = entry.lines(original_tokens)
+                self._put(key, entry)
+            return list(entry)
+
+        lines = find_concordance(pivot_tokens, target_tokens, span, context, original_tokens, cleaned_tokens,
+                                 tokens_no_stamming, allow_self_reference, ignore_punctuation, tokens_are_lowercase)
+        self._put(key, lines)
+        return list(lines)
+
+    def collocation_finder(self, pivot_tokens, target_tokens, words, span, allow_self_reference=False,
+                           document_key=None):
+        """
+        Return ``BigramCollocationFinder.from_words`` of the same arguments,
+        from the cache if possible.
+
+        :param document_key: if given, identifies the contents of ``words``
+            in place of hashing them
+        """
+        if document_key is None:
+            document_key = _fingerprint(words)
+        key = ("finder", document_key, _token_set(pivot_tokens), _token_set(target_tokens), tuple(span),
+               bool(allow_self_reference))
+        finder = self._get(key)
+        if finder is None:
+            finder = BigramCollocationFinder.from_words(pivot_tokens, target_tokens, words, span,
+                                                        allow_self_reference)
+            self._put(key, finder)
+        return finder
+
+    def stats(self):
+        """
+        Return the numbers of ``hits`` (including the ``disk_hits``),
+        ``misses`` and ``evictions``, and the number of results held in
+        memory (``size``) and on disk (``spilled``).
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                    "evictions": self.evictions, "size": len(self._entries), "spilled": len(self._spilled)}
+
+    def clear(self):
+        """Forget all cached results, removing those this cache spilled to disk."""
+        with self._lock:
+            self._entries.clear()
+            spilled, self._spilled = self._spilled, set()
+        for path in spilled:
             try:
-                right_span = original_tokens[
-                             min(len(original_tokens)-1, index_mapping[pos] + 1):
-                             min(len(original_tokens)-1,index_mapping[pos + 1+ span[1]])]
-            except IndexError:
-                right_span = original_tokens[
-                             min(len(original_tokens) - 1, index_mapping[pos] + 1):
-                             len(original_tokens)]
-                context_right_exists = False
-
-            if ignore_punctuation:
-                contains_target_token = False
-                try:
-                    contains_target_token = target_token in left_span
-                    index = left_span.index('.')
-                    tmp_left_span = left_span[max(0,index):len(left_span)]
-                    if target_token not in tmp_left_span and contains_target_token:
-                        pass
-                    else:
-                        left_span = tmp_left_span
-                        context_left_exists = False
-
-                except ValueError:
-                    pass
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _path(self, key):
+        digest = hashlib.blake2b(repr(key).encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, "concordance-%s.pickle" % digest)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # re-insert the entry as the most recently used
+                self._entries[key] = entry
+                self.hits += 1
+                return entry
+        if self.directory is not None:
+            try:
+                with open(self._path(key), "rb") as fp:
+                    entry = pickle.load(fp)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += 1
+        if entry is not None and not isinstance(entry, DetachedConcordanceLines):
+            self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            evicted = []
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                evicted.append((oldest, self._entries.pop(oldest)))
+                self.evictions += 1
+        if self.directory is not None:
+            for key, entry in evicted:
+                self._spill(key, entry)
+
+    def _spill(self, key, entry):
+        if isinstance(entry, list):
+            entry = DetachedConcordanceLines(entry)
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._spilled.add(path)
+
+
+class DetachedConcordanceLines:
+    """
+    The concordance lines of one query in a picklable form, which leaves out
+    the original tokens the lines refer to, e.g. to send the lines to
+    another process that has the tokens::
 
-                try:
-                    contains_target_token = target_token in right_span
-                    index = right_span.index('.')
-                    tmp_right_span = right_span[:min(len(right_span)-1,index + 1)]
-
-                    if target_token not in tmp_right_span and contains_target_token:
-                        pass
-                    else:
-                        right_span = tmp_right_span
-                        context_right_exists = False
-                except ValueError:
-                    pass
+        detached = DetachedConcordanceLines(find_concordance(...))
+        lines = detached.lines(original_tokens)
+    """
 
-            # get additional context
+    def __init__(self, lines):
+        self.finder = lines[0]._collocations._finder if lines else None
+        self.fields = [(line._offsets, line._context_left_exists, line._context_right_exists, line.query, line.dist,
+                        line._collocation_key) for line in lines]
 
-            if pos - span[0] > 0 and context_left_exists:
-                try:
-                    left_context = original_tokens[
-                                   max(0,max(0, index_mapping[pos - span[0]] - context[0])): index_mapping[max(0,pos - span[0])]]
-                except IndexError:
-                    left_context = original_tokens[max(0, original_tokens[0]): index_mapping[pos - span[0]]]
-            else:
-                left_context = []
-            if pos + span[1] < len(original_tokens) - 1 and context_right_exists:
-                try:
-                    right_context = original_tokens[
-                                    index_mapping[min(len(original_tokens),pos + span[1]) + 1]:
-                                    min(len(original_tokens),index_mapping[pos + span[1]]+context[1]+2)]
-                except IndexError:
-                    right_context = original_tokens[
-                                    index_mapping[min(len(original_tokens), pos + span[1])] + 1:
-                                    len(original_tokens)]
-            else:
-                right_context = []
+    def lines(self, original_tokens):
+        """Rebuild the lines over ``original_tokens``."""
+        collocations = _CollocationViews(self.finder)
+        return [ConcordanceLine(original_tokens, offsets, left_exists, right_exists, query, dist, key, collocations)
+                for offsets, left_exists, right_exists, query, dist, key in self.fields]
 
-            if ignore_punctuation:
-                try:
-                    index = left_context.index('.')
-                    left_context = left_context[max(0,index):len(left_context)]
-                except ValueError:
-                    pass
 
-                try:
-                    index = right_context.index('.')
-                    right_context = right_context[:min(len(right_context),index + 1)]
-                except ValueError:
-                    pass
+def _fingerprint(tokens, chunk_size=65536):
+    """
+    Return a digest of the contents of a sequence of string tokens, an
+    ``EncodedCorpus`` or a ``CollocationIndex``.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(tokens, EncodedCorpus):
+        digest.update(b"encoded:")
+        digest.update(_fingerprint(tokens.vocabulary, chunk_size).encode("ascii"))
+        digest.update(tokens.ids.tobytes())
+        return digest.hexdigest()
+    if isinstance(tokens, CollocationIndex):
+        tokens = tokens._words
+    digest.update(str(len(tokens)).encode("ascii"))
+    tokens = iter(tokens)
+    chunk = list(islice(tokens, chunk_size))
+    while chunk:
+        digest.update("\x00".join(map(str, chunk)).encode("utf-8", "surrogatepass"))
+        digest.update(b"\x00")
+        chunk = list(islice(tokens, chunk_size))
+    return digest.hexdigest()
+
+
+def _token_set(tokens):
+    return tuple(sorted(set(tokens)))
+
+
+def _collocation_finder(pivot_tokens, target_tokens, cleaned_tokens, span, allow_self_reference):
+    if isinstance(cleaned_tokens, CollocationIndex):
+        return BigramCollocationFinder.from_index(pivot_tokens, target_tokens, cleaned_tokens, span,
+                                                  allow_self_reference)
+    return BigramCollocationFinder.from_words(pivot_tokens, target_tokens, cleaned_tokens, span,
+                                              allow_self_reference)
+
+
+def _collocation_order(b):
+    """
+    Generate the ``(collocation, i)`` hits of the finder ``b``, where ``i``
+    indexes ``b.pos[collocation]``, grouped by collocation.
+    """
+    for collocation, positions in b.pos.items():
+        for i in range(len(positions)):
+            yield collocation, i
 
-            # Create the pretty lines with the query_word in the middle.
-            left_span_print = " ".join(left_span)
-            right_span_print = " ".join(right_span)
 
-            if context_left_exists:
-                left_context_print = " ".join(left_context)
-            else:
-                left_context_print = " "
+def _corpus_order(b):
+    """
+    Return the ``(collocation, i)`` hits of the finder ``b`` ordered by the
+    position of their query word, and then as in ``_collocation_order``.
+    """
+    collocations = list(b.pos)
+    hits = []
+    for order, collocation in enumerate(collocations):
+        hits.extend((pos, order, i) for i, pos in enumerate(b.pos[collocation]))
+    hits.sort()
+    return [(collocations[order], i) for _, order, i in hits]
 
-            if context_right_exists:
-                right_context_print = " ".join(right_context)
-            else:
-                right_context_print = " "
-
-            left_print = " ".join([left_context_print, left_span_print])
-            right_print = " ".join([right_span_print, right_context_print])
-            # The WYSIWYG line of the concordance.
-            line_print = " ".join([left_print, query_word, right_print])
-
-            coll_fd = FreqDist()
-            coll_fd[collocation] = b.ngram_fd[collocation]
-
-            word_fd = FreqDist()
-            word_fd[collocation[0]] = b.word_fd[collocation[0]]
-            word_fd[collocation[1]] = b.word_fd[collocation[1]]
-
-            b_line = BigramCollocationFinder(word_fd,coll_fd,b.pos,b.dist,b.window_size)
-
-
-            # Create the ConcordanceLine
-            concordance_line = ConcordanceLine(
-                left_context_print,
-                left_span_print,
-                query_word,
-                right_span_print,
-                right_context_print,
-                left_print,
-                right_print,
-                line_print,
-                b_line,
-                b.dist[collocation][i]
-
-            )
-            concordance_list.append(concordance_line)
-    return concordance_list
+
+def _original_index(index_mapping, pos, cleaned_tokens):
+    """
+    Return the index in the original tokens of the cleaned token at ``pos``.
+
+    :raise IndexError: if ``pos`` is past the end of ``index_mapping``
+    :raise ValueError: if the cleaned token could not be mapped
+    """
+    index = index_mapping[pos]
+    if index is None or index < 0:
+        raise ValueError("Cleaned token %d (%r) could not be mapped to the original tokens"
+                         % (pos, cleaned_tokens[pos]))
+    return index
+
+
+def _iter_concordance_lines(b, hits, span, context, original_tokens, cleaned_tokens, index_mapping,
+                            ignore_punctuation, sentence_boundaries=None):
+    """
+    Generate the concordance line of each ``(collocation, i)`` hit, where
+    ``i`` indexes the pivot positions ``b.pos[collocation]``.
+    """
+    n_tokens = len(original_tokens)
+    if sentence_boundaries is None:
+        sentence_boundaries = _TokenBoundaries(original_tokens)
+    collocations = _CollocationViews(b)
+    stats = current_instrumentation()
+
+    for collocation, i in hits:
+        if stats is not None:
+            line_start = perf_counter()
+            punctuation_time = 0.0
+        pos = b.pos[collocation][i]
+        query_word = cleaned_tokens[pos]
+
+        words = b._decode_ngram(collocation)
+        if words[0] == query_word:
+            target_token = words[1]
+        else:
+            target_token = words[0]
+
+        query_index = _original_index(index_mapping, pos, cleaned_tokens)
+
+        # Find the context of query word.
+        # i- context = contex left span
+        context_left_exists = True
+        context_right_exists = True
+
+        left_start, left_stop = _slice_bounds(max(0, query_index - span[0] - 1), query_index, n_tokens)
+
+        try:
+            right_start, right_stop = _slice_bounds(min(n_tokens - 1, query_index + 1),
+                                                    min(n_tokens - 1, _original_index(index_mapping, pos + 1 + span[1], cleaned_tokens)),
+                                                    n_tokens)
+        except IndexError:
+            right_start, right_stop = _slice_bounds(min(n_tokens - 1, query_index + 1), n_tokens, n_tokens)
+            context_right_exists = False
+
+        if ignore_punctuation:
+            if stats is not None:
+                punctuation_start = perf_counter()
+            index = sentence_boundaries.first(left_start, left_stop)
+            if index is not None:
+                contains_target_token = _find_token(original_tokens, target_token, left_start,
+                                                    left_stop) is not None
+                if contains_target_token and _find_token(original_tokens, target_token, index,
+                                                         left_stop) is None:
+                    pass
+                else:
+                    left_start = index
+                    context_left_exists = False
+
+            index = sentence_boundaries.first(right_start, right_stop)
+            if index is not None:
+                contains_target_token = _find_token(original_tokens, target_token, right_start,
+                                                    right_stop) is not None
+                tmp_right_stop = right_start + min(right_stop - right_start - 1, index - right_start + 1)
+                if contains_target_token and _find_token(original_tokens, target_token, right_start,
+                                                         tmp_right_stop) is None:
+                    pass
+                else:
+                    right_stop = tmp_right_stop
+                    context_right_exists = False
+            if stats is not None:
+                punctuation_time += perf_counter() - punctuation_start
+
+        # get additional context
+
+        if pos - span[0] > 0 and context_left_exists:
+            context_index = _original_index(index_mapping, pos - span[0], cleaned_tokens)
+            left_context_start, left_context_stop = _slice_bounds(max(0, context_index - context[0]),
+                                                                  context_index, n_tokens)
+        else:
+            left_context_start = left_context_stop = 0
+        if pos + span[1] < n_tokens - 1 and context_right_exists:
+            try:
+                right_context_start, right_context_stop = _slice_bounds(
+                    _original_index(index_mapping, min(n_tokens, pos + span[1]) + 1, cleaned_tokens),
+                    min(n_tokens, _original_index(index_mapping, pos + span[1], cleaned_tokens) + context[1] + 2),
+                    n_tokens)
+            except IndexError:
+                right_context_start, right_context_stop = _slice_bounds(
+                    _original_index(index_mapping, min(n_tokens, pos + span[1]), cleaned_tokens) + 1, n_tokens,
+                    n_tokens)
+        else:
+            right_context_start = right_context_stop = 0
+
+        if ignore_punctuation:
+            if stats is not None:
+                punctuation_start = perf_counter()
+            index = sentence_boundaries.first(left_context_start, left_context_stop)
+            if index is not None:
+                left_context_start = index
+
+            index = sentence_boundaries.first(right_context_start, right_context_stop)
+            if index is not None:
+                right_context_stop = index + 1
+            if stats is not None:
+                punctuation_time += perf_counter() - punctuation_start
+
+        # Create the ConcordanceLine; its text is only built when read.
+        offsets = (left_context_start, left_context_stop, left_start, left_stop,
+                   right_start, right_stop, right_context_start, right_context_stop)
+        concordance_line = ConcordanceLine(
+            original_tokens,
+            offsets,
+            context_left_exists,
+            context_right_exists,
+            query_word,
+            b.dist[collocation][i],
+            collocation,
+            collocations,
+        )
+        if stats is not None:
+            stats.add_time("slicing", perf_counter() - line_start - punctuation_time)
+            stats.add_time("punctuation", punctuation_time)
+            stats.count("hits")
+        yield concordance_line
+
+
+def _slice_bounds(start, stop, length):
+    """
+    Return the non-negative ``(start, stop)`` offsets selected by the slice
+    ``[start:stop]`` of a sequence of the given length.
+    """
+    start, stop, _ = slice(start, stop).indices(length)
+    return start, max(start, stop)
+
+
+def _find_token(tokens, token, start, stop):
+    """
+    Return the offset of the first occurrence of ``token`` in
+    ``tokens[start:stop]``, or None.
+    """
+    if start >= stop:
+        return None
+    try:
+        return tokens.index(token, start, stop)
+    except ValueError:
+        return None
@@ -11,9 +11,13 @@ import re
 import textwrap
 import pydoc
 import os
+import threading
 
+from array import array
+from collections import deque
 from itertools import combinations, tee
 from pprint import pprint
+from time import perf_counter
 
 from urllib.request import (
     build_opener,
@@ -1038,40 +1042,221 @@ def parallelize_preprocess(func, iterator, processes, progress_bar=False):
 ############################################################################
 
 def map_cleaned_corpus(corpus, cleaned_corpus, tokens_are_lowercase):
-    mapping = []
-    # list with cleaned corpus tokens that are yet to be mapped
-    # ('token',index_original_corpus)
-    backlog = []
+    """
+    Map each token of ``cleaned_corpus`` (the corpus with tokens such as
+    punctuation removed) to the index of the token it came from in
+    ``corpus``.  Cleaned tokens that cannot be aligned are mapped to None.
+
+        >>> map_cleaned_corpus(['I', ',', 'like', 'you'], ['I', 'like', 'you'], False)
+        [0, 2, 3]
+
+    :param corpus: the original tokens
+    :type corpus: list(str)
+    :param cleaned_corpus: the cleaned tokens
+    :type cleaned_corpus: list(str)
+    :param tokens_are_lowercase: whether the cleaned tokens were lowercased
+    :type tokens_are_lowercase: bool
+    :rtype: list(int or None)
+    """
+    return [i if i >= 0 else None for i in map_cleaned_corpus_array(corpus, cleaned_corpus, tokens_are_lowercase)]
 
-    cleaned_data_end = False
 
-    for i in range(len(corpus)):
+def map_cleaned_corpus_array(corpus, cleaned_corpus, tokens_are_lowercase):
+    """
+    Like ``map_cleaned_corpus``, but return the mapping as a compact
+    ``array('l')`` in which cleaned tokens that cannot be aligned are
+    mapped to -1.
 
-        if i > len(cleaned_corpus) - 1:
-            cleaned_data_end = True
+    Every cleaned token that does not line up with the original token at
+    the same index is queued, and is aligned with the next original token
+    equal to it.  Queued tokens are kept in a dictionary of per-token queues,
+    so the alignment runs in linear time however many tokens were removed.
 
+    :rtype: array
+    """
+    n_cleaned = len(cleaned_corpus)
+    mapping = array("l", [-1]) * min(len(corpus), n_cleaned)
+    # cleaned tokens that are yet to be mapped, by token:
+    # {'token': deque([index_cleaned_corpus, ...])}
+    backlog = {}
+    n_backlog = 0
+
+    for i in range(len(corpus)):
         corpus_token = corpus[i]
 
         if tokens_are_lowercase:
-            corpus_token = corpus[i].lower()
+            corpus_token = corpus_token.lower()
 
-        if len(backlog) > 0:
-            for pair in backlog:
-                if pair[0] == corpus_token:
-                    mapping[pair[1]] = i
-                    backlog.remove(pair)
-                    break
+        if n_backlog > 0:
+            pending = backlog.get(corpus_token)
+            if pending:
+                mapping[pending.popleft()] = i
+                n_backlog -= 1
 
-            if cleaned_data_end is False:
-                backlog.append((cleaned_corpus[i], i))
-                mapping.append(None)
+            if i < n_cleaned:
+                backlog.setdefault(cleaned_corpus[i], deque()).append(i)
+                n_backlog += 1
 
-        elif cleaned_data_end is False and cleaned_corpus[i] == corpus_token:
-            mapping.append(i)
+        elif i < n_cleaned and cleaned_corpus[i] == corpus_token:
+            mapping[i] = i
 
-        elif cleaned_data_end is True:
+        elif i >= n_cleaned:
             break
         else:
-            mapping.append(None)
-            backlog.append((cleaned_corpus[i], i))
+            backlog.setdefault(cleaned_corpus[i], deque()).append(i)
+            n_backlog += 1
+    return mapping
+
+
+_map_cleaned_corpus_cache = {}
+_map_cleaned_corpus_cache_lock = threading.Lock()
+_MAP_CLEANED_CORPUS_CACHE_SIZE = 4
+
+
+def cached_map_cleaned_corpus(corpus, cleaned_corpus, tokens_are_lowercase, version=None):
+    """
+    Return ``map_cleaned_corpus_array(corpus, cleaned_corpus,
+    tokens_are_lowercase)``, reusing the mapping computed for the same
+    token lists in an earlier call.  Pass the result as the
+    ``index_mapping`` of ``find_concordance`` to align a document once for
+    many queries.
+
+    The last few mappings are kept, least recently used first, together
+    with references to the token list objects they were computed for; a
+    mapping is only reused for the very same list objects, and the same
+    ``version``.  The lists are not compared, so pass a new ``version``
+    (e.g. a counter incremented on each edit) after modifying them in
+    place.  Call ``clear_map_cleaned_corpus_cache()`` to release the lists.
+
+    :rtype: array
+    """
+    key = (id(corpus), id(cleaned_corpus), bool(tokens_are_lowercase))
+    with _map_cleaned_corpus_cache_lock:
+        entry = _map_cleaned_corpus_cache.pop(key, None)
+        if entry is not None and entry[0] is corpus and entry[1] is cleaned_corpus and entry[2] == version:
+            # re-insert the entry as the most recently used
+            _map_cleaned_corpus_cache[key] = entry
+            return entry[3]
+
+    mapping = map_cleaned_corpus_array(corpus, cleaned_corpus, tokens_are_lowercase)
+
+    with _map_cleaned_corpus_cache_lock:
+        _map_cleaned_corpus_cache[key] = (corpus, cleaned_corpus, version, mapping)
+        while len(_map_cleaned_corpus_cache) > _MAP_CLEANED_CORPUS_CACHE_SIZE:
+            del _map_cleaned_corpus_cache[next(iter(_map_cleaned_corpus_cache))]
     return mapping
+
+
+def clear_map_cleaned_corpus_cache():
+    """Forget all mappings cached by ``cached_map_cleaned_corpus``."""
+    with _map_cleaned_corpus_cache_lock:
+        _map_cleaned_corpus_cache.clear()
+
+
+######################################################################
+# Instrumentation
+######################################################################
+
+_instrumentation_local = threading.local()
+
+
+class Instrumentation:
+    """
+    Per-stage timings and counters of the concordance and collocation
+    functions called while it is active.
+
+    Instrumentation is activated for the current thread by using it as a
+    context manager, and ``callback`` is called with it on exit, e.g. to
+    export the figures to a monitoring system::
+
+        with Instrumentation(callback=report) as stats:
+            lines = find_concordance(...)
+        stats.timings['collocations'], stats.counters['hits']
+
+    When no instrumentation is active, the instrumented functions only pay
+    for one thread-local lookup per call.  Instrumentations may be nested,
+    in which case only the innermost one is updated.
+
+    :ivar timings: the seconds spent in each stage, by stage name
+    :ivar counters: the value of each counter, by counter name
+    """
+
+    def __init__(self, callback=None):
+        self.timings = {}
+        self.counters = {}
+        self.callback = callback
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def stage(self, stage):
+        """
+        Return a context manager adding the time spent in its block to the
+        timing of ``stage``.
+        """
+        return _Stage(self, stage)
+
+    def as_dict(self):
+        return {"timings": dict(self.timings), "counters": dict(self.counters)}
+
+    def __enter__(self):
+        stack = getattr(_instrumentation_local, "stack", None)
+        if stack is None:
+            stack = _instrumentation_local.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _instrumentation_local.stack.remove(self)
+        if self.callback is not None:
+            self.callback(self)
+
+    def __repr__(self):
+        return "<Instrumentation: %r>" % self.as_dict()
+
+
+class _Stage:
+    __slots__ = ("_instrumentation", "_stage", "_start")
+
+    def __init__(self, instrumentation, stage):
+        self._instrumentation = instrumentation
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._instrumentation.add_time(self._stage, perf_counter() - self._start)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def current_instrumentation():
+    """
+    Return the innermost ``Instrumentation`` active in the current thread,
+    or None.
+    """
+    stack = getattr(_instrumentation_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def instrumented_stage(stats, stage):
+    """
+    Return a context manager timing ``stage`` in the instrumentation
+    ``stats``, or doing nothing if ``stats`` is None.
+    """
+    return _NULL_STAGE if stats is None else _Stage(stats, stage)